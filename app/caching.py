@@ -0,0 +1,195 @@
+import hashlib
+import os
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Any
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .compression import MIN_SIZE, accepted_encodings, compress, negotiate_encoding
+
+# Request headers that select between different representations of the same URL
+VARY = ("HX-Request", "Accept", "Accept-Encoding")
+
+
+def content_version(build_version: str, *paths: str) -> str:
+    """Combine the database build version with a hash of the files (e.g. templates) that responses are rendered from.
+    Each path is a directory (hashed recursively) or a file, which is skipped if it does not exist.
+    """
+    digest = hashlib.sha256(build_version.encode("utf-8"))
+    for path in paths:
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                digest.update(f.read())
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                with open(os.path.join(root, name), "rb") as f:
+                    digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+class ConditionalGetMiddleware:
+    """Add strong ETags and Cache-Control to cacheable GET responses, and answer a matching If-None-Match with 304.
+
+    Cacheable responses only change when the content version does (the database build, app code, templates or
+    image renditions), so the ETag is derived from it, the representation-selecting request headers and the
+    Content-Encoding actually sent (which depends on the route: most are only gzipped by GZipMiddleware). A 304 is
+    sent before the request reaches any route, without touching the database or templates, if If-None-Match has the
+    ETag of a representation in any encoding the request accepts: it is still current, and the client can decode it.
+    If-None-Match: * is not honoured, since it would answer 304 before knowing whether the resource exists.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        version: str,
+        paths: list[str],
+        prefixes: list[str],
+        exclude: list[str],
+        cache_control: str = "public, max-age=300",
+    ):
+        self.app = app
+        self.version = version
+        self.paths = set(paths)
+        self.prefixes = tuple(prefixes)
+        self.exclude = set(exclude)
+        self.cache_control = cache_control
+
+    def is_cacheable(self, scope: Scope) -> bool:
+        path = scope["path"]
+        return (
+            scope["method"] in ("GET", "HEAD")
+            and path.lower() not in self.exclude
+            and (path in self.paths or path.startswith(self.prefixes))
+        )
+
+    def etag(self, headers: Headers, encoding: str | None) -> str:
+        representation = "|".join(
+            (
+                str(bool(headers.get("hx-request"))),
+                str("application/x-ndjson" in headers.get("accept", "")),
+                encoding or "identity",
+            )
+        )
+        return f'"{self.version}-{hashlib.sha256(representation.encode("utf-8")).hexdigest()[:8]}"'
+
+    def matching_etag(self, headers: Headers) -> str | None:
+        """Return the first If-None-Match ETag of a representation in an encoding the request accepts, or None"""
+        if not (if_none_match := headers.get("if-none-match")):
+            return None
+        encodings = [None, *accepted_encodings(headers.get("accept-encoding"))]
+        etags = {self.etag(headers, encoding) for encoding in encodings}
+        tags = (t.strip().removeprefix("W/") for t in if_none_match.split(","))
+        return next((tag for tag in tags if tag in etags), None)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self.is_cacheable(scope):
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        cache_headers = {"Cache-Control": self.cache_control, "Vary": ", ".join(VARY)}
+
+        if etag := self.matching_etag(request_headers):
+            cache_headers["ETag"] = etag
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 304,
+                    "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in cache_headers.items()],
+                }
+            )
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_with_cache_headers(message: Message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                headers = MutableHeaders(scope=message)
+                for key, value in cache_headers.items():
+                    headers[key] = value
+                headers["ETag"] = self.etag(request_headers, headers.get("content-encoding"))
+            await send(message)
+
+        await self.app(scope, receive, send_with_cache_headers)
+
+
+class LRUCache:
+    """Least-recently-used cache holding at most `maxsize` entries and, if given, at most `maxbytes` bytes as
+    measured by `sizeof`, with hit/miss counters.
+
+    Entries belong to a content version (e.g. the database build version): looking up a different version
+    clears the cache, so nothing rendered from an old build is ever served.
+
+    A value larger than `maxbytes` is never stored. A value that grows after it is stored (e.g. a CachedResponse
+    gaining a compressed variant) is re-measured by setting it again.
+    """
+
+    def __init__(self, maxsize: int, maxbytes: int | None = None, sizeof: Callable[[Any], int] | None = None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.version: str | None = None
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, version: str | None) -> Any | None:
+        if version != self.version:
+            self.clear()
+            self.version = version
+        try:
+            value, _ = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        size = self.sizeof(value) if self.sizeof else 0
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key)[1]
+        if self.maxbytes is not None and size > self.maxbytes:
+            return
+        self._entries[key] = (value, size)
+        self.nbytes += size
+        while len(self._entries) > self.maxsize or (self.maxbytes is not None and self.nbytes > self.maxbytes):
+            self.nbytes -= self._entries.popitem(last=False)[1][1]
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+
+class CachedResponse:
+    """A rendered response body, with each compressed variant created the first time it is needed and then kept"""
+
+    def __init__(self, body: bytes, media_type: str | None, headers: dict[str, str]):
+        self.body = body
+        self.media_type = media_type
+        self.headers = headers
+        self.compressed: dict[str, bytes] = {}
+
+    @property
+    def size(self) -> int:
+        """Bytes held: the body and every compressed variant created so far"""
+        return len(self.body) + sum(len(body) for body in self.compressed.values())
+
+    def response(self, accept_encoding: str | None, headers: dict[str, str] | None = None) -> Response:
+        headers = {**self.headers, **(headers or {}), "Vary": "Accept-Encoding"}
+        encoding = negotiate_encoding(accept_encoding) if len(self.body) >= MIN_SIZE else None
+        if encoding is None:
+            return Response(content=self.body, media_type=self.media_type, headers=headers)
+        if encoding not in self.compressed:
+            self.compressed[encoding] = compress(self.body, encoding)
+        headers["Content-Encoding"] = encoding
+        return Response(content=self.compressed[encoding], media_type=self.media_type, headers=headers)
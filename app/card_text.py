@@ -0,0 +1,323 @@
+import re
+from urllib.parse import quote_plus
+
+
+def _bold(text: str) -> str:
+    return f"<b>{text}</b>"
+
+
+def _italic(text: str) -> str:
+    return f"<i>{text}</i>"
+
+
+def _span(text: str, classes: str, aria_desc: str | None = None) -> str:
+    return f'<span class="{classes}" {f'aria-description="{aria_desc}"' if aria_desc else ""}>{text}</span>'
+
+
+def _image(src: str, alt: str, classes: str | None = None) -> str:
+    return f'<img src="{src}" alt="{alt}" {f'class="{classes}"' if classes else ""}>'
+
+
+def _link(text: str, href: str, classes: str | None = None) -> str:
+    return f'<a href="{href}" {f'class="{classes}"' if classes else ""}>{text}</a>'
+
+
+def clean_punctuation(text: str) -> str:
+    text = re.sub(r'"(.+)"', lambda x: f"“{x.group(1)}”", text)
+    text = re.sub(r" - ", " — ", text)
+    text = re.sub(r"'", "’", text)
+    text = re.sub(r"\.\.\.", "…", text)
+    text = re.sub(r" (-|–)(\d+)/", lambda x: f" −{x.group(2)}/", text)
+    text = re.sub(r"/(-|–)(\d+)", lambda x: f"/−{x.group(2)}", text)
+    return text
+
+
+class CardTextVocabulary:
+    """Traits and keywords to link in card text, with their regex patterns compiled ONCE.
+
+    The trait patterns contain hundreds of alternatives, so build a single instance per process and reuse it.
+    """
+
+    def __init__(self, traits: list[str], keywords: list[str]):
+        self.traits = traits
+        self.keywords = keywords
+
+        # "trait"/"traits" not preceded by a specific trait, checked by lookup instead of hundreds of lookbehinds
+        self._specific_trait_prefixes = {f"{t} ".lower() for t in traits}
+        self._specific_trait_lengths = sorted({len(p) for p in self._specific_trait_prefixes})
+        self.generic_trait = re.compile(r"traits?", flags=re.IGNORECASE)
+
+        trait_grp = _trie_pattern(traits)
+        self.trait_series = re.compile(
+            rf"({trait_grp})?(?:, )?({trait_grp})(,? and |,? or | non-)({trait_grp})", flags=re.IGNORECASE
+        )
+        self.trait_unit = re.compile(
+            rf"({trait_grp})((?: ground| space| leader)? (?:unit|card|event))", flags=re.IGNORECASE
+        )
+        self.attached_trait = re.compile(rf"(attached unit is (?:a |an )?)({trait_grp})", flags=re.IGNORECASE)
+        self.if_its_trait = re.compile(rf"(if it’s (?:a |an )?)({trait_grp})", flags=re.IGNORECASE)
+        self.search_trait = re.compile(rf"(search [^.]+ deck for [^.]+ )({trait_grp})", flags=re.IGNORECASE)
+        self.trait_trait = re.compile(rf"({trait_grp}) trait", flags=re.IGNORECASE)
+
+        self._keyword_links: dict[str, re.Pattern[str]] = {}
+        self._generic_keywords: dict[tuple[str, ...], re.Pattern[str]] = {}
+        for keyword in keywords:
+            self.keyword_link(keyword)
+
+    def is_specific_trait(self, text: str, start: int) -> bool:
+        """Check whether the text before `start` ends with a specific trait (and a space)"""
+        return any(
+            text[start - length : start].lower() in self._specific_trait_prefixes
+            for length in self._specific_trait_lengths
+            if length <= start
+        )
+
+    def keyword_link(self, keyword: str) -> re.Pattern[str]:
+        if keyword not in self._keyword_links:
+            self._keyword_links[keyword] = re.compile(rf"({keyword})( \d+)?( \[.+\])?")
+        return self._keyword_links[keyword]
+
+    def generic_keyword(self, keywords: list[str]) -> re.Pattern[str]:
+        """Pattern for "keyword"/"keywords" not preceded by one of the card's keywords"""
+        key = tuple(keywords)
+        if key not in self._generic_keywords:
+            not_specific_kw = "".join(f"(?<!{k} )" for k in keywords)
+            self._generic_keywords[key] = re.compile(rf"{not_specific_kw}keywords?", flags=re.IGNORECASE)
+        return self._generic_keywords[key]
+
+
+def _trie_pattern(words: list[str]) -> str:
+    """Build a regex alternation of the words, nested as a trie so each character is only tested once per position.
+    Alternatives keep the order of the input list (which decides the match when several words fit).
+    """
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def _build(node: dict) -> str:
+        options = [re.escape(char) + _build(child) if char else "" for char, child in node.items()]
+        if len(options) == 1:
+            return options[0]
+        return f"(?:{'|'.join(options)})"
+
+    return _build(trie) if words else "(?!)"
+
+
+def htmlify_card_text(
+    text: str, variant_type: str, keywords: list[str], vocabulary: CardTextVocabulary, is_pilot: bool = False
+) -> str:
+    """Format a card's text (one side or its epic action) as HTML, with links to traits, keywords and aspects"""
+    # Initalize multi-line flags
+    pilot_text_start_line = None
+
+    lines = text.strip().split("\n")
+    for i, line in enumerate(lines):
+        # Initialize flags
+        full_sentinel = False
+        conditional_sentinel = False
+
+        # Punctuation cleanup
+        line = clean_punctuation(line)
+
+        # Bold action/trigger text
+        line = re.sub(r"Epic Action:", lambda x: _bold(x.group(0)), line)
+        line = re.sub(r"Action(?: \[.+\])?:", lambda x: _bold(x.group(0)), line)
+        line = re.sub(r"When [^.:]+:", lambda x: _bold(x.group(0)), line)
+        line = re.sub(r"On [^.:]+:", lambda x: _bold(x.group(0)), line)
+
+        # Replace text with appropriate symbols/images
+        line = re.sub(
+            r"(\[.*)Exhaust(.*\])",
+            lambda x: (
+                f"{x.group(1)}{_image('/images/icons/exhaust.svg', 'Exhaust', classes='exhaust')}{x.group(2)}"
+            ),
+            line,
+            flags=re.IGNORECASE,
+        )
+        line = re.sub(
+            r"(Aggression|Command|Cunning|Heroism|Vigilance|Villainy)",
+            lambda x: _link(
+                _image(f"/images/aspects/{x.group(1)}-small.png", alt=x.group(1), classes="aspect-img"),
+                f"/search?aspect={x.group(1)}&variant_type=Normal",
+            ),
+            line,
+            flags=re.IGNORECASE,
+        )
+        line = re.sub(
+            r"(non-)?(unique)( \((?:non-)?unique\))",
+            lambda x: (
+                f"{x.group(1) if x.group(1) else ''}{_span('✧', classes='unique', aria_desc='Unique')}{x.group(3)}"
+            ),
+            line,
+            flags=re.IGNORECASE,
+        )
+
+        # Italicize reminder text on Normal variants, hide it on others
+        line = re.sub(
+            r"( ?\(.+?\))",
+            lambda x: _span(x.group(1), classes="reminder") if variant_type == "Normal" else "",
+            line,
+        )
+
+        # Italicize and uppercase "trait"/"traits" in text (unless preceded by a specific trait)
+        line = vocabulary.generic_trait.sub(
+            lambda x: (
+                x.group(0) if vocabulary.is_specific_trait(x.string, x.start()) else _span(x.group(0), classes="trait")
+            ),
+            line,
+        )
+
+        # Bold and uppercase "keyword"/"keywords" in text (unless preceded by a specific keyword)
+        line = vocabulary.generic_keyword(keywords).sub(lambda x: _span(x.group(0), classes="keyword"), line)
+
+        # Add keyword links, flag SENTINEL/PILOTING lines
+        if keywords:
+            for keyword in keywords:
+                if keyword == "SENTINEL":
+                    if line.startswith(keyword) or line.startswith(f"Attached unit gains {keyword}"):
+                        full_sentinel = True
+                    elif re.search(rf"(?:this|attached) unit [^.]*gains [^.]*{keyword}", line, flags=re.IGNORECASE):
+                        conditional_sentinel = True
+                elif keyword == "PILOTING":
+                    if line.startswith(keyword):
+                        pilot_text_start_line = i
+                line = vocabulary.keyword_link(keyword).sub(
+                    lambda x: _span(
+                        f"{_link(x.group(1) + (x.group(2) or ''), f'/search?keyword={x.group(1)}&variant_type=Normal')}{x.group(3) or ''}",
+                        classes="keyword",
+                    ),
+                    line,
+                )
+                line = re.sub(
+                    r"BOUNTIES",
+                    _link("BOUNTIES", "/search?keyword=BOUNTY&variant_type=Normal", classes="keyword"),
+                    line,
+                )
+
+        # Check for pilot upgrade text
+        if (
+            is_pilot
+            and pilot_text_start_line is None
+            and re.search(r"(attached unit|this upgrade)", line, flags=re.IGNORECASE)
+        ):
+            pilot_text_start_line = i
+
+        # Add trait links
+        line = vocabulary.trait_series.sub(
+            lambda x: (
+                (
+                    _link(
+                        x.group(1).upper(),
+                        f"/search?trait={quote_plus(x.group(1).upper())}&variant_type=Normal",
+                        classes="trait",
+                    )
+                    + ", "
+                    if x.group(1)
+                    else ""
+                )
+                + _link(
+                    x.group(2).upper(),
+                    f"/search?trait={quote_plus(x.group(2).upper())}&variant_type=Normal",
+                    classes="trait",
+                )
+                + x.group(3)
+                + _link(
+                    x.group(4).upper(),
+                    f"/search?trait={quote_plus(x.group(4).upper())}&variant_type=Normal",
+                    classes="trait",
+                )
+            ),
+            line,
+        )
+        line = vocabulary.trait_unit.sub(
+            lambda x: (
+                f"{_link(x.group(1).upper(), f'/search?trait={quote_plus(x.group(1).upper())}&variant_type=Normal', classes='trait')}{x.group(2)}"
+            ),
+            line,
+        )
+        line = vocabulary.attached_trait.sub(
+            lambda x: (
+                f"{x.group(1)}{_link(x.group(2).upper(), f'/search?trait={quote_plus(x.group(2).upper())}&variant_type=Normal', classes='trait')}"
+            ),
+            line,
+        )
+        line = vocabulary.if_its_trait.sub(
+            lambda x: (
+                f"{x.group(1)}{_link(x.group(2).upper(), f'/search?trait={quote_plus(x.group(2).upper())}&variant_type=Normal', classes='trait')}"
+            ),
+            line,
+        )
+        line = vocabulary.search_trait.sub(
+            lambda x: (
+                f"{x.group(1)}{_link(x.group(2).upper(), f'/search?trait={quote_plus(x.group(2).upper())}&variant_type=Normal', classes='trait')}"
+            ),
+            line,
+        )
+        line = vocabulary.trait_trait.sub(
+            lambda x: (
+                f"{_link(x.group(1).upper(), f'/search?trait={quote_plus(x.group(1).upper())}&variant_type=Normal', classes='trait')} trait"
+            ),
+            line,
+        )
+        line = re.sub(
+            r"(unit without a )(pilot)( on it)",
+            lambda x: (
+                f"{x.group(1)}{_link(x.group(2).upper(), f'/search?trait={quote_plus(x.group(2).upper())}&variant_type=Normal', classes='trait')}{x.group(3)}"
+            ),
+            line,
+            flags=re.IGNORECASE,
+        )
+
+        # Add badges for cost and buffs/debuffs
+        line = re.sub(r"C=(\d+)", lambda x: _span(x.group(1), classes="badge cost"), line, flags=re.IGNORECASE)
+        line = re.sub(
+            r"Action \[(\d+)",
+            lambda x: f"Action [{_span(x.group(1), classes='badge cost')}",
+            line,
+            flags=re.IGNORECASE,
+        )
+        line = re.sub(
+            r"(costs?|pays?) (\d+)",
+            lambda x: f"{x.group(1)} {_span(x.group(2), classes='badge cost')}",
+            line,
+        )
+        line = re.sub(
+            r"([+-–−]?\d+)/([+-–−]?\d+)",
+            lambda x: (
+                f"{_span(x.group(1), classes='badge power')}/{_span(x.group(2), classes='badge hp')}"
+            ),
+            line,
+        )
+        line = re.sub(
+            r"(\d+)(( or (:?less|more)(?: remaining)?)? HP)",
+            lambda x: f"{_span(x.group(1), classes='badge hp')}{x.group(2)}",
+            line,
+        )
+        line = re.sub(
+            r"(\d+)(( or (:?less|more))? power)",
+            lambda x: f"{_span(x.group(1), classes='badge power')}{x.group(2)}",
+            line,
+        )
+
+        # Wrap each line in a <p> tag
+        line = f'<p class="card-text">{line}</p>'
+
+        # Add sentinel decoration
+        if full_sentinel:
+            line = f'<div class="alert alert-danger p-2 mb-1">{line}</div>'
+        elif conditional_sentinel:
+            line = f'<div class="alert alert-danger p-2 mb-1 text-body" style="background: none;">{line}</div>'
+
+        # Add PILOTING decoration
+        if i == pilot_text_start_line:
+            line = f'<div class="alert alert-light p-2 mb-1">{line}'
+
+        lines[i] = line
+
+    formatted_text = "\n".join(line for line in lines if line)
+    if pilot_text_start_line is not None:
+        formatted_text += "</div>"
+    return formatted_text
@@ -0,0 +1,316 @@
+import base64
+import random
+from bisect import bisect_right
+from collections import defaultdict
+
+from sqlalchemy.orm import Session, contains_eager, defer, selectinload
+
+from .database import SWUCard, SWUSet
+
+# Card attributes that can be filtered on, each with its own posting lists and bitsets
+FACETS = (
+    "set_id",
+    "rotation",
+    "aspect",
+    "trait",
+    "keyword",
+    "arena",
+    "rarity",
+    "card_type",
+    "variant_type",
+    "artist",
+)
+
+# Numeric card attributes that can be filtered by range, from their integer "{stat}_value" columns
+STATS = ("cost", "power", "hp")
+
+# Facets whose per-value result counts are returned with search results, for the search form's options
+COUNTED_FACETS = (
+    "aspect",
+    "trait",
+    "keyword",
+    "arena",
+    "card_type",
+    "rarity",
+    "set_id",
+    "variant_type",
+)
+
+
+class Catalog:
+    """Read-only, in-memory copy of every card, indexed for fast filtering.
+
+    Cards are held in (set number, card number) order, and each card is identified by its position in that list.
+    For each facet value, a posting list (sorted positions) and a bitset (int with bit i set for position i) are
+    kept, so any combination of filters is answered with bitwise ANDs that are already in display order. For each
+    numeric stat, the bitsets of cards with at most each of its distinct values are kept, so a range is answered
+    with a binary search and a bitwise AND NOT. The positions of each variant group (cards with the same name, type
+    and subtitle) are kept in display order too.
+    """
+
+    def __init__(self, cards: list[SWUCard]):
+        self.cards = cards
+        self.all_bits = (1 << len(cards)) - 1
+        self.positions = {card.id: i for i, card in enumerate(cards)}
+        self.sort_keys = [sort_key(card) for card in cards]
+        self.variant_groups: dict[int, list[int]] = defaultdict(list)
+        self.name_postings: dict[str, list[int]] = defaultdict(list)
+        for i, card in enumerate(cards):
+            self.variant_groups[card.variant_group_id].append(i)
+            self.name_postings[card.name_search].append(i)
+        self.postings: dict[str, dict[str, list[int]]] = {facet: defaultdict(list) for facet in FACETS}
+        for i, card in enumerate(cards):
+            for facet, values in self._facet_values(card).items():
+                for value in values:
+                    self.postings[facet][value].append(i)
+        self.bitsets = {
+            facet: {value: self._to_bits(positions) for value, positions in values.items()}
+            for facet, values in self.postings.items()
+        }
+        self.stat_values: dict[str, list[int]] = {}
+        self.stat_at_most: dict[str, list[int]] = {}
+        for stat in STATS:
+            postings = defaultdict(list)
+            for i, card in enumerate(cards):
+                if (value := getattr(card, f"{stat}_value")) is not None:
+                    postings[value].append(i)
+            self.stat_values[stat] = sorted(postings)
+            self.stat_at_most[stat] = []
+            bits = 0
+            for value in self.stat_values[stat]:
+                bits |= self._to_bits(postings[value])
+                self.stat_at_most[stat].append(bits)
+
+    @classmethod
+    def load(cls, db: Session) -> "Catalog":
+        """Load every card (with its set and child rows) from the database in display order."""
+        cards = (
+            db.query(SWUCard)
+            .join(SWUCard.card_set)
+            .options(
+                contains_eager(SWUCard.card_set),
+                defer(SWUCard.front_text_rendered),
+                defer(SWUCard.back_text_rendered),
+                defer(SWUCard.epic_action_rendered),
+                selectinload(SWUCard.arenas),
+                selectinload(SWUCard.aspects),
+                selectinload(SWUCard.traits),
+                selectinload(SWUCard.keywords),
+            )
+            .order_by(SWUSet.number, SWUCard.number)
+            .all()
+        )
+        return cls(cards)
+
+    @staticmethod
+    def _facet_values(card: SWUCard) -> dict[str, list[str]]:
+        values = {
+            "set_id": [card.set_id],
+            "rotation": [card.card_set.rotation],
+            "aspect": [a.aspect for a in card.aspects],
+            "trait": [t.trait for t in card.traits],
+            "keyword": [k.keyword for k in card.keywords],
+            "arena": [a.arena for a in card.arenas],
+            "rarity": [card.rarity],
+            "card_type": [card.card_type],
+            "variant_type": [card.variant_type],
+            "artist": [card.artist_search],
+        }
+        return {facet: [v for v in vals if v] for facet, vals in values.items()}
+
+    @staticmethod
+    def _to_bits(positions: list[int]) -> int:
+        bits = bytearray(positions[-1] // 8 + 1) if positions else bytearray()
+        for i in positions:
+            bits[i // 8] |= 1 << (i % 8)
+        return int.from_bytes(bits, "little")
+
+    @staticmethod
+    def _from_bits(bits: int) -> list[int]:
+        return [i for i, b in enumerate(bin(bits)[:1:-1]) if b == "1"]
+
+    def filter(self, **facets: str | list[str] | None) -> int:
+        """Return the bitset of cards matching every given (non-empty) facet term, or list of terms.
+
+        Every term must match: a term is a value, or values separated by "|" of which any must match, and a term
+        starting with "-" must not match. So aspect=["Vigilance|Command", "-Villainy"] is the cards with the
+        Vigilance or Command aspect but not the Villainy aspect.
+        """
+        bits = self.all_bits
+        for facet, terms in facets.items():
+            for term in [terms] if isinstance(terms, str) else terms or []:
+                if term.startswith("-"):
+                    bits &= ~self._any_bits(facet, term[1:])
+                elif term:
+                    bits &= self._any_bits(facet, term)
+        return bits
+
+    def _any_bits(self, facet: str, values: str) -> int:
+        bitsets = self.bitsets[facet]
+        if "|" not in values:
+            return bitsets.get(values, 0)
+        bits = 0
+        for value in values.split("|"):
+            bits |= bitsets.get(value, 0)
+        return bits
+
+    def stat_range(self, stat: str, minimum: int | None = None, maximum: int | None = None) -> int:
+        """Return the bitset of cards with a value of the stat between minimum and maximum (inclusive, and either
+        can be None for no bound). Cards without a value of the stat never match.
+        """
+        values, at_most = self.stat_values[stat], self.stat_at_most[stat]
+        if maximum is None:
+            bits = at_most[-1] if at_most else 0
+        else:
+            i = bisect_right(values, maximum)
+            bits = at_most[i - 1] if i else 0
+        if minimum is not None and (i := bisect_right(values, minimum - 1)):
+            bits &= ~at_most[i - 1]
+        return bits
+
+    def contains(self, facet: str, value: str) -> int:
+        """Return the bitset of cards with any value of facet containing the given string (case-insensitive)."""
+        value = value.lower()
+        bits = 0
+        for facet_value, facet_bits in self.bitsets[facet].items():
+            if value in facet_value.lower():
+                bits |= facet_bits
+        return bits
+
+    def facet_counts(self, bits: int, **facets: str | list[str] | None) -> dict[str, dict[str, int]]:
+        """Return the number of cards for each value of every counted facet, among the cards in the bitset that
+        match every given (non-empty) facet term (as in filter).
+
+        A facet's own terms are left out of its counts, so they show how many results choosing another value would
+        give. Counts are popcounts of the bitsets, so no card is visited and values without cards are omitted.
+        """
+        facets = {facet: value for facet, value in facets.items() if value}
+        counts = {}
+        for facet in COUNTED_FACETS:
+            facet_bits = bits & self.filter(**{f: v for f, v in facets.items() if f != facet})
+            counts[facet] = {
+                value: count
+                for value, value_bits in self.bitsets[facet].items()
+                if (count := (facet_bits & value_bits).bit_count())
+            }
+        return counts
+
+    def variants(self, variant_group_id: int) -> list[SWUCard]:
+        """Return every variant in a card's variant group, in (set number, card number) order."""
+        cards = self.cards
+        return [cards[i] for i in self.variant_groups.get(variant_group_id, [])]
+
+    def random_card(self, **facets: str | list[str] | None) -> SWUCard | None:
+        """Return a random card matching every given (non-empty) facet term (as in filter), or None if none match.
+
+        Without filters, or with a single value, this is a constant-time pick from the card list or posting list.
+        """
+        facets = {facet: terms for facet, terms in facets.items() if terms}
+        if not facets:
+            positions = range(len(self.cards))
+        elif len(facets) == 1 and (value := _single_value(*facets.values())):
+            [facet] = facets
+            positions = self.postings[facet].get(value, [])
+        else:
+            positions = self._from_bits(self.filter(**facets))
+        return self.cards[random.choice(positions)] if positions else None
+
+    def find(self, card_ids: list[str]) -> tuple[list[SWUCard], list[str]]:
+        """Return the cards with the given IDs in the given order, and the IDs that aren't any card's."""
+        cards, missing = [], []
+        for card_id in card_ids:
+            if (i := self.positions.get(card_id)) is not None:
+                cards.append(self.cards[i])
+            else:
+                missing.append(card_id)
+        return cards, missing
+
+    def bits_for_ids(self, card_ids: set[str]) -> int:
+        """Return the bitset of the cards with the given IDs."""
+        positions = self.positions
+        return self._to_bits(sorted(positions[card_id] for card_id in card_ids if card_id in positions))
+
+    def bits_for_names(self, names: list[str]) -> int:
+        """Return the bitset of the cards with any of the given folded names and subtitles (name_search values)."""
+        return self._to_bits(sorted(i for name in names for i in self.name_postings.get(name, [])))
+
+    def cards_for(self, bits: int) -> list[SWUCard]:
+        """Return the cards in the bitset, in (set number, card number) order."""
+        cards = self.cards
+        return [cards[i] for i in self._from_bits(bits)]
+
+    def page(
+        self,
+        bits: int,
+        after: tuple[int, ...] | None = None,
+        limit: int | None = None,
+        names: list[str] | None = None,
+    ) -> tuple[list[SWUCard], bool]:
+        """Return up to `limit` cards in the bitset that sort after the page_key `after`, and whether any more cards
+        remain after them.
+
+        Cards are in (set number, card number) order, or if folded names (name_search values, best first) are given,
+        in order of their name's rank among them, then in (set number, card number) order.
+        """
+        if names is not None:
+            return self._ranked_page(bits, names, after, limit)
+        if after is not None:
+            start = bisect_right(self.sort_keys, after)
+            bits = bits >> start << start
+        positions = self._from_bits(bits)
+        cards = self.cards
+        return [cards[i] for i in positions[:limit]], limit is not None and len(positions) > limit
+
+    def _ranked_page(
+        self, bits: int, names: list[str], after: tuple[int, ...] | None, limit: int | None
+    ) -> tuple[list[SWUCard], bool]:
+        positions = []
+        for rank, name in enumerate(names):
+            if after is not None and rank < after[0]:
+                continue
+            for i in self.name_postings.get(name, []):
+                if bits >> i & 1 and (after is None or (rank, *self.sort_keys[i]) > after):
+                    positions.append(i)
+            if limit is not None and len(positions) > limit:
+                break
+        cards = self.cards
+        return [cards[i] for i in positions[:limit]], limit is not None and len(positions) > limit
+
+
+def _single_value(terms: str | list[str]) -> str | None:
+    """Return the value of a single, plain (not "|" or "-") facet term, or None"""
+    if not isinstance(terms, str):
+        if len(terms) != 1:
+            return None
+        [terms] = terms
+    return None if terms.startswith("-") or "|" in terms else terms
+
+
+def sort_key(card: SWUCard) -> tuple[int, int]:
+    return card.card_set.number, card.number
+
+
+def page_key(card: SWUCard, names: list[str] | None = None) -> tuple[int, ...]:
+    """Return the key of a card in the order of Catalog.page: its (set number, card number), preceded by the rank of
+    its folded name among `names` if given
+    """
+    return (names.index(card.name_search), *sort_key(card)) if names is not None else sort_key(card)
+
+
+def encode_cursor(card: SWUCard, names: list[str] | None = None) -> str:
+    """Return an opaque pagination cursor pointing just after the given card (in the order of Catalog.page)"""
+    return base64.urlsafe_b64encode(":".join(map(str, page_key(card, names))).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, ranked: bool = False) -> tuple[int, ...]:
+    """Return the page_key of a pagination cursor (with a name rank if `ranked`), or raise ValueError if it is
+    invalid
+    """
+    try:
+        parts = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split(":")
+        key = tuple(int(part) for part in parts)
+        if len(key) != (3 if ranked else 2):
+            raise ValueError
+        return key
+    except ValueError as e:
+        raise ValueError(f"Invalid cursor '{cursor}'") from e
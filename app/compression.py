@@ -0,0 +1,147 @@
+"""Precompress static assets and pre-rendered pages, and serve compressed variants by content negotiation.
+
+Run from the repository root (after pre-rendering): python -m app.compression
+"""
+
+import gzip
+import os
+from mimetypes import guess_type
+
+import brotli
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import NotModifiedResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# Supported content encodings in order of preference, with the suffix of their precompressed files
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+
+# Files worth compressing, and the smallest body worth compressing
+COMPRESSIBLE_SUFFIXES = (".css", ".html", ".js", ".json", ".svg", ".txt")
+MIN_SIZE = 500
+
+
+def compress(body: bytes, encoding: str, best: bool = False) -> bytes:
+    """Compress a body with the given encoding (best=True for slower, smaller build-time compression)"""
+    if encoding == "br":
+        return brotli.compress(body, quality=11 if best else 5)
+    return gzip.compress(body, compresslevel=9 if best else 6, mtime=0)
+
+
+def accepted_encodings(accept_encoding: str | None) -> list[str]:
+    """Return the supported encodings allowed by an Accept-Encoding header, in order of preference"""
+    if not accept_encoding:
+        return []
+    accepted = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return [encoding for encoding in ENCODINGS if accepted.get(encoding, accepted.get("*", 0.0)) > 0]
+
+
+def negotiate_encoding(accept_encoding: str | None) -> str | None:
+    """Return the preferred supported encoding allowed by an Accept-Encoding header, or None for identity"""
+    return next(iter(accepted_encodings(accept_encoding)), None)
+
+
+def precompress_directory(directory: str) -> int:
+    """Write a compressed sibling of every compressible file in the directory for each encoding, if missing or stale"""
+    count = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE_SUFFIXES):
+                continue
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            if stat.st_size < MIN_SIZE:
+                continue
+            body = None
+            for encoding, suffix in ENCODINGS.items():
+                try:
+                    if os.stat(path + suffix).st_mtime >= stat.st_mtime:
+                        continue
+                except FileNotFoundError:
+                    pass
+                if body is None:
+                    with open(path, "rb") as f:
+                        body = f.read()
+                with open(path + suffix, "wb") as f:
+                    f.write(compress(body, encoding, best=True))
+                count += 1
+    return count
+
+
+def precompressed_file_response(
+    path: str, scope: Scope, stat_result: os.stat_result | None = None, **kwargs
+) -> FileResponse:
+    """Return a FileResponse for the path, using its precompressed sibling for the negotiated encoding if it exists"""
+    headers = {"Vary": "Accept-Encoding"}
+    encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+    if encoding:
+        compressed_path = path + ENCODINGS[encoding]
+        try:
+            compressed_stat = os.stat(compressed_path)
+        except FileNotFoundError:
+            pass
+        else:
+            media_type = kwargs.pop("media_type", None) or guess_type(path)[0] or "text/plain"
+            return FileResponse(
+                compressed_path,
+                media_type=media_type,
+                headers={**headers, "Content-Encoding": encoding},
+                stat_result=compressed_stat,
+                **kwargs,
+            )
+    return FileResponse(path, headers=headers, stat_result=stat_result or os.stat(path), **kwargs)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that serves precompressed siblings (e.g. styles.css.br) to clients that accept them"""
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        full_path = str(full_path)
+        if not full_path.endswith(COMPRESSIBLE_SUFFIXES):
+            return super().file_response(full_path, stat_result, scope, status_code=status_code)
+        response = precompressed_file_response(full_path, scope, stat_result=stat_result, status_code=status_code)
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+class DynamicGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware for dynamic responses only: paths under `exclude` (mounted PrecompressedStaticFiles) pass
+    through untouched, so a file without a precompressed sibling is not gzipped on the fly under its identity ETag,
+    and its Vary header is not repeated
+    """
+
+    def __init__(self, app: ASGIApp, exclude: list[str], minimum_size: int = 500, compresslevel: int = 9):
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel)
+        self.exclude = tuple(exclude)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http" and scope["path"].startswith(self.exclude):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+def main():
+    from .prerender import PRERENDER_DIR
+
+    for directory in ("app/static", PRERENDER_DIR):
+        if os.path.exists(directory):
+            count = precompress_directory(directory)
+            print(f"Wrote {count:,} compressed files ({', '.join(ENCODINGS)}) in {directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,51 @@
-import re
-from urllib.parse import quote_plus
+import os
+import sqlite3
+from functools import cache
 
-from sqlalchemy import ForeignKey, create_engine, func
+from sqlalchemy import Engine, ForeignKey, create_engine, event, func
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import Mapped, declarative_base, mapped_column, relationship, sessionmaker
 
+from .card_text import CardTextVocabulary, clean_punctuation, htmlify_card_text
+
 DATABASE = "data/db.sqlite3"
 
-engine = create_engine(f"sqlite:///{DATABASE}", connect_args={"check_same_thread": False})
+# Production mode: the app never writes to the database, and data/create_db.py only ever replaces it whole
+READ_ONLY = bool(os.environ.get("DATABASE_READ_ONLY"))
+READ_ONLY_PRAGMAS = {
+    "mmap_size": 256 * 1024 * 1024,  # Read pages straight from the OS page cache, shared by every worker process
+    "cache_size": -64 * 1024,  # 64 MiB per connection
+    "query_only": 1,
+    "temp_store": "MEMORY",
+}
+READ_ONLY_POOL_SIZE = 64  # Warm connections kept, more than the threads that may run queries (the threadpool's 40)
+
+
+def make_engine(read_only: bool = False) -> Engine:
+    """Return an engine for the database, read-only with tuned pragmas and a pool of warm connections if read_only.
+
+    A read-only engine opens the file as immutable, so SQLite skips locking and change detection. It keeps reading
+    the file it opened even after create_db.py swaps in a new database, until the app is restarted.
+    """
+    if not read_only:
+        return create_engine(f"sqlite:///{DATABASE}", connect_args={"check_same_thread": False})
+    read_only_engine = create_engine(
+        f"sqlite:///file:{DATABASE}?mode=ro&immutable=1&uri=true",
+        connect_args={"check_same_thread": False},
+        pool_size=READ_ONLY_POOL_SIZE,
+    )
+
+    @event.listens_for(read_only_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in READ_ONLY_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+        cursor.close()
+
+    return read_only_engine
+
+
+engine = make_engine(READ_ONLY)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -20,6 +58,38 @@ def get_db():
         db.close()
 
 
+def current_build_version() -> str | None:
+    """Return the build version of the database file now at DATABASE, which may be newer than the one the app loaded
+    (create_db.py swaps in a new file). It is only read again when the file is replaced, so this is just a stat.
+    """
+    stat = os.stat(DATABASE)
+    return _file_build_version(stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+
+
+@cache
+def _file_build_version(dev: int, ino: int, mtime_ns: int) -> str | None:
+    con = sqlite3.connect(f"file:{DATABASE}?mode=ro", uri=True)
+    try:
+        row = con.execute("SELECT value FROM metadata WHERE key = 'build_version'").fetchone()
+    finally:
+        con.close()
+    return row[0] if row else None
+
+
+@cache
+def get_card_text_vocabulary() -> CardTextVocabulary:
+    """Return the traits/keywords vocabulary for formatting card text, queried and compiled ONCE per process"""
+    db = SessionLocal()
+    try:
+        traits = [t.trait for t in db.query(SWUCardTrait.trait).distinct().order_by(SWUCardTrait.trait) if t.trait]
+        keywords = [
+            k.keyword for k in db.query(SWUCardKeyword.keyword).distinct().order_by(SWUCardKeyword.keyword) if k.keyword
+        ]
+    finally:
+        db.close()
+    return CardTextVocabulary(traits, keywords)
+
+
 class SWUSet(Base):
     __tablename__ = "sets"
     id: Mapped[str] = mapped_column(primary_key=True)
@@ -49,23 +119,21 @@ class SWUCard(Base):
     back_text: Mapped[str | None] = mapped_column()
     artist: Mapped[str] = mapped_column()
     artist_search: Mapped[str] = mapped_column()
+    front_text_rendered: Mapped[str | None] = mapped_column()
+    back_text_rendered: Mapped[str | None] = mapped_column()
+    epic_action_rendered: Mapped[str | None] = mapped_column()
+    variant_group_id: Mapped[int] = mapped_column(index=True)
+    cost_value: Mapped[int | None] = mapped_column()
+    power_value: Mapped[int | None] = mapped_column()
+    hp_value: Mapped[int | None] = mapped_column()
+    name_search: Mapped[str] = mapped_column()
+    content_hash: Mapped[str] = mapped_column()
     arenas: Mapped[list["SWUCardArena"]] = relationship()
     aspects: Mapped[list["SWUCardAspect"]] = relationship()  # relationship(order_by="SWUCardAspect.sort_order")
     traits: Mapped[list["SWUCardTrait"]] = relationship()
     keywords: Mapped[list["SWUCardKeyword"]] = relationship()
     card_set: Mapped["SWUSet"] = relationship(back_populates="cards")
 
-    @property
-    def _all_traits(self) -> list[str]:
-        session = get_db()
-        db = session.__next__()
-        all_traits = [
-            t.trait for t in db.query(SWUCardTrait.trait).distinct().order_by(SWUCardTrait.trait).all() if t.trait
-        ]
-        del db
-        session.close()
-        return all_traits
-
     @hybrid_property
     def name_and_subtitle(self) -> str:  # type: ignore
         return self.name + " " + (self.subtitle or "")
@@ -92,281 +160,30 @@ class SWUCard(Base):
 
     @hybrid_property
     def front_text_html(self) -> str:
+        if self.front_text_rendered is not None:
+            return self.front_text_rendered
         is_pilot = any(t.trait == "PILOT" for t in self.traits)
         return self._htmlify_card_text(self.front_text or "", is_pilot=is_pilot)
 
     @hybrid_property
     def back_text_html(self) -> str:
+        if self.back_text_rendered is not None:
+            return self.back_text_rendered
         is_pilot = any(t.trait == "PILOT" for t in self.traits)
         return self._htmlify_card_text(self.back_text or "", is_pilot=is_pilot)
 
     @hybrid_property
     def epic_action_html(self) -> str:
+        if self.epic_action_rendered is not None:
+            return self.epic_action_rendered
         return self._htmlify_card_text(self.epic_action or "")
 
-    @staticmethod
-    def _bold(text: str) -> str:
-        return f"<b>{text}</b>"
-
-    @staticmethod
-    def _italic(text: str) -> str:
-        return f"<i>{text}</i>"
-
-    @staticmethod
-    def _span(text: str, classes: str, aria_desc: str | None = None) -> str:
-        return f'<span class="{classes}" {f'aria-description="{aria_desc}"' if aria_desc else ""}>{text}</span>'
-
-    @staticmethod
-    def _image(src: str, alt: str, classes: str | None = None) -> str:
-        return f'<img src="{src}" alt="{alt}" {f'class="{classes}"' if classes else ""}>'
-
-    @staticmethod
-    def _link(text: str, href: str, classes: str | None = None) -> str:
-        return f'<a href="{href}" {f'class="{classes}"' if classes else ""}>{text}</a>'
-
     def _clean_punctuation(self, text: str) -> str:
-        text = re.sub(r'"(.+)"', lambda x: f"“{x.group(1)}”", text)
-        text = re.sub(r" - ", " — ", text)
-        text = re.sub(r"'", "’", text)
-        text = re.sub(r"\.\.\.", "…", text)
-        text = re.sub(r" (-|–)(\d+)/", lambda x: f" −{x.group(2)}/", text)
-        text = re.sub(r"/(-|–)(\d+)", lambda x: f"/−{x.group(2)}", text)
-        return text
+        return clean_punctuation(text)
 
     def _htmlify_card_text(self, text: str, is_pilot: bool = False) -> str:
-        # Initalize multi-line flags
-        pilot_text_start_line = None
-
-        lines = text.strip().split("\n")
-        for i, line in enumerate(lines):
-            # Initialize flags
-            full_sentinel = False
-            conditional_sentinel = False
-
-            # Punctuation cleanup
-            line = self._clean_punctuation(line)
-
-            # Bold action/trigger text
-            line = re.sub(r"Epic Action:", lambda x: self._bold(x.group(0)), line)
-            line = re.sub(r"Action(?: \[.+\])?:", lambda x: self._bold(x.group(0)), line)
-            line = re.sub(r"When [^.:]+:", lambda x: self._bold(x.group(0)), line)
-            line = re.sub(r"On [^.:]+:", lambda x: self._bold(x.group(0)), line)
-
-            # Replace text with appropriate symbols/images
-            line = re.sub(
-                r"(\[.*)Exhaust(.*\])",
-                lambda x: (
-                    f"{x.group(1)}{self._image('/images/icons/exhaust.svg', 'Exhaust', classes='exhaust')}{x.group(2)}"
-                ),
-                line,
-                flags=re.IGNORECASE,
-            )
-            line = re.sub(
-                r"(Aggression|Command|Cunning|Heroism|Vigilance|Villainy)",
-                lambda x: self._link(
-                    self._image(f"/images/aspects/{x.group(1)}-small.png", alt=x.group(1), classes="aspect-img"),
-                    f"/search?aspect={x.group(1)}&variant_type=Normal",
-                ),
-                line,
-                flags=re.IGNORECASE,
-            )
-            line = re.sub(
-                r"(non-)?(unique)( \((?:non-)?unique\))",
-                lambda x: (
-                    f"{x.group(1) if x.group(1) else ''}{self._span('✧', classes='unique', aria_desc='Unique')}{x.group(3)}"
-                ),
-                line,
-                flags=re.IGNORECASE,
-            )
-
-            # Italicize reminder text on Normal variants, hide it on others
-            line = re.sub(
-                r"( ?\(.+?\))",
-                lambda x: self._span(x.group(1), classes="reminder") if self.variant_type == "Normal" else "",
-                line,
-            )
-
-            # Italicize and uppercase "trait"/"traits" in text (unless preceded by a specific trait)
-            not_specific_trait = "".join(f"(?<!{t} )" for t in self._all_traits)
-            line = re.sub(
-                rf"{not_specific_trait}traits?",
-                lambda x: self._span(x.group(0), classes="trait"),
-                line,
-                flags=re.IGNORECASE,
-            )
-
-            # Bold and uppercase "keyword"/"keywords" in text (unless preceded by a specific keyword)
-            keywords = [k.keyword for k in self.keywords if k.keyword]
-            not_specific_kw = "".join(f"(?<!{k} )" for k in keywords)
-            line = re.sub(
-                rf"{not_specific_kw}keywords?",
-                lambda x: self._span(x.group(0), classes="keyword"),
-                line,
-                flags=re.IGNORECASE,
-            )
-
-            # Add keyword links, flag SENTINEL/PILOTING lines
-            if keywords:
-                for keyword in keywords:
-                    if keyword == "SENTINEL":
-                        if line.startswith(keyword) or line.startswith(f"Attached unit gains {keyword}"):
-                            full_sentinel = True
-                        elif re.search(rf"(?:this|attached) unit [^.]*gains [^.]*{keyword}", line, flags=re.IGNORECASE):
-                            conditional_sentinel = True
-                    elif keyword == "PILOTING":
-                        if line.startswith(keyword):
-                            pilot_text_start_line = i
-                    line = re.sub(
-                        rf"({keyword})( \d+)?( \[.+\])?",
-                        lambda x: self._span(
-                            f"{self._link(x.group(1) + (x.group(2) or ''), f'/search?keyword={x.group(1)}&variant_type=Normal')}{x.group(3) or ''}",
-                            classes="keyword",
-                        ),
-                        line,
-                    )
-                    line = re.sub(
-                        r"BOUNTIES",
-                        self._link("BOUNTIES", "/search?keyword=BOUNTY&variant_type=Normal", classes="keyword"),
-                        line,
-                    )
-
-            # Check for pilot upgrade text
-            if (
-                is_pilot
-                and pilot_text_start_line is None
-                and re.search(r"(attached unit|this upgrade)", line, flags=re.IGNORECASE)
-            ):
-                pilot_text_start_line = i
-
-            # Add trait links
-            TRAIT_GRP = "|".join(self._all_traits)
-            line = re.sub(
-                rf"({TRAIT_GRP})?(?:, )?({TRAIT_GRP})(,? and |,? or | non-)({TRAIT_GRP})",
-                lambda x: (
-                    (
-                        self._link(
-                            x.group(1).upper(),
-                            f"/search?trait={quote_plus(x.group(1).upper())}&variant_type=Normal",
-                            classes="trait",
-                        )
-                        + ", "
-                        if x.group(1)
-                        else ""
-                    )
-                    + self._link(
-                        x.group(2).upper(),
-                        f"/search?trait={quote_plus(x.group(2).upper())}&variant_type=Normal",
-                        classes="trait",
-                    )
-                    + x.group(3)
-                    + self._link(
-                        x.group(4).upper(),
-                        f"/search?trait={quote_plus(x.group(4).upper())}&variant_type=Normal",
-                        classes="trait",
-                    )
-                ),
-                line,
-                flags=re.IGNORECASE,
-            )
-            line = re.sub(
-                rf"({TRAIT_GRP})((?: ground| space| leader)? (?:unit|card|event))",
-                lambda x: (
-                    f"{self._link(x.group(1).upper(), f'/search?trait={quote_plus(x.group(1).upper())}&variant_type=Normal', classes='trait')}{x.group(2)}"
-                ),
-                line,
-                flags=re.IGNORECASE,
-            )
-            line = re.sub(
-                rf"(attached unit is (?:a |an )?)({TRAIT_GRP})",
-                lambda x: (
-                    f"{x.group(1)}{self._link(x.group(2).upper(), f'/search?trait={quote_plus(x.group(2).upper())}&variant_type=Normal', classes='trait')}"
-                ),
-                line,
-                flags=re.IGNORECASE,
-            )
-            line = re.sub(
-                rf"(if it’s (?:a |an )?)({TRAIT_GRP})",
-                lambda x: (
-                    f"{x.group(1)}{self._link(x.group(2).upper(), f'/search?trait={quote_plus(x.group(2).upper())}&variant_type=Normal', classes='trait')}"
-                ),
-                line,
-                flags=re.IGNORECASE,
-            )
-            line = re.sub(
-                rf"(search [^.]+ deck for [^.]+ )({TRAIT_GRP})",
-                lambda x: (
-                    f"{x.group(1)}{self._link(x.group(2).upper(), f'/search?trait={quote_plus(x.group(2).upper())}&variant_type=Normal', classes='trait')}"
-                ),
-                line,
-                flags=re.IGNORECASE,
-            )
-            line = re.sub(
-                rf"({TRAIT_GRP}) trait",
-                lambda x: (
-                    f"{self._link(x.group(1).upper(), f'/search?trait={quote_plus(x.group(1).upper())}&variant_type=Normal', classes='trait')} trait"
-                ),
-                line,
-                flags=re.IGNORECASE,
-            )
-            line = re.sub(
-                r"(unit without a )(pilot)( on it)",
-                lambda x: (
-                    f"{x.group(1)}{self._link(x.group(2).upper(), f'/search?trait={quote_plus(x.group(2).upper())}&variant_type=Normal', classes='trait')}{x.group(3)}"
-                ),
-                line,
-                flags=re.IGNORECASE,
-            )
-
-            # Add badges for cost and buffs/debuffs
-            line = re.sub(r"C=(\d+)", lambda x: self._span(x.group(1), classes="badge cost"), line, flags=re.IGNORECASE)
-            line = re.sub(
-                r"Action \[(\d+)",
-                lambda x: f"Action [{self._span(x.group(1), classes='badge cost')}",
-                line,
-                flags=re.IGNORECASE,
-            )
-            line = re.sub(
-                r"(costs?|pays?) (\d+)",
-                lambda x: f"{x.group(1)} {self._span(x.group(2), classes='badge cost')}",
-                line,
-            )
-            line = re.sub(
-                r"([+-–−]?\d+)/([+-–−]?\d+)",
-                lambda x: (
-                    f"{self._span(x.group(1), classes='badge power')}/{self._span(x.group(2), classes='badge hp')}"
-                ),
-                line,
-            )
-            line = re.sub(
-                r"(\d+)(( or (:?less|more)(?: remaining)?)? HP)",
-                lambda x: f"{self._span(x.group(1), classes='badge hp')}{x.group(2)}",
-                line,
-            )
-            line = re.sub(
-                r"(\d+)(( or (:?less|more))? power)",
-                lambda x: f"{self._span(x.group(1), classes='badge power')}{x.group(2)}",
-                line,
-            )
-
-            # Wrap each line in a <p> tag
-            line = f'<p class="card-text">{line}</p>'
-
-            # Add sentinel decoration
-            if full_sentinel:
-                line = f'<div class="alert alert-danger p-2 mb-1">{line}</div>'
-            elif conditional_sentinel:
-                line = f'<div class="alert alert-danger p-2 mb-1 text-body" style="background: none;">{line}</div>'
-
-            # Add PILOTING decoration
-            if i == pilot_text_start_line:
-                line = f'<div class="alert alert-light p-2 mb-1">{line}'
-
-            lines[i] = line
-
-        formatted_text = "\n".join(line for line in lines if line)
-        if pilot_text_start_line is not None:
-            formatted_text += "</div>"
-        return formatted_text
+        keywords = [k.keyword for k in self.keywords if k.keyword]
+        return htmlify_card_text(text, self.variant_type, keywords, get_card_text_vocabulary(), is_pilot=is_pilot)
 
 
 class SWUCardArena(Base):
@@ -398,3 +215,9 @@ class SWUCardKeyword(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     card_id: Mapped[str] = mapped_column(ForeignKey("cards.id"))
     keyword: Mapped[str | None] = mapped_column()
+
+
+class SWUMetadata(Base):
+    __tablename__ = "metadata"
+    key: Mapped[str] = mapped_column(primary_key=True)
+    value: Mapped[str] = mapped_column()
@@ -0,0 +1,62 @@
+import json
+import os
+
+CARD_IMAGE_DIR = "app/static/images/cards"
+CARD_IMAGE_URL = "/images/cards"
+
+# Written by data/fetch_card_images.py: {"SET/number[-back]": [rendition widths..., full width]}
+MANIFEST_FILE = os.path.join(CARD_IMAGE_DIR, "manifest.json")
+
+# Width of the thumbnails shown in card lists
+THUMBNAIL_WIDTH = 200
+
+
+def rendition_path(directory: str, name: str, width: int) -> str:
+    """Return the path of the rendition of image `name` (e.g. 001.webp) in `directory` at the given width"""
+    return os.path.join(directory, str(width), name)
+
+
+class CardImages:
+    """URLs of each card face's full-size image and its fixed-width renditions, for srcset attributes.
+
+    Without a manifest (or for a face missing from it), only the full-size image is used.
+    """
+
+    def __init__(self, manifest: dict[str, list[int]]):
+        self.manifest = manifest
+
+    @classmethod
+    def load(cls, path: str = MANIFEST_FILE) -> "CardImages":
+        try:
+            with open(path) as f:
+                return cls(json.load(f))
+        except FileNotFoundError:
+            return cls({})
+
+    @staticmethod
+    def _key(set_id: str, card_id: str, back: bool) -> str:
+        return f"{set_id}/{card_id[4:]}{'-back' if back else ''}"
+
+    def src(self, set_id: str, card_id: str, back: bool = False, width: int | None = None) -> str:
+        """Return the URL of a card face's image, at the given rendition width if it exists, else full size"""
+        key = self._key(set_id, card_id, back)
+        set_id, _, name = key.partition("/")
+        if width is not None and width in self.manifest.get(key, [])[:-1]:
+            return f"{CARD_IMAGE_URL}/{set_id}/{width}/{name}.webp"
+        return f"{CARD_IMAGE_URL}/{key}.webp"
+
+    def srcset(self, set_id: str, card_id: str, back: bool = False) -> str | None:
+        """Return a srcset of every rendition and the full-size image of a card face, or None if it has none"""
+        widths = self.manifest.get(self._key(set_id, card_id, back))
+        if not widths:
+            return None
+        *renditions, full_width = widths
+        candidates = [f"{self.src(set_id, card_id, back, width)} {width}w" for width in renditions]
+        candidates.append(f"{self.src(set_id, card_id, back)} {full_width}w")
+        return ", ".join(candidates)
+
+    def thumbnail(self, set_id: str, card_id: str, back: bool = False) -> str | None:
+        """Return the URL of a card face's thumbnail rendition, or None if it has none"""
+        if THUMBNAIL_WIDTH in self.manifest.get(self._key(set_id, card_id, back), [])[:-1]:
+            return self.src(set_id, card_id, back, THUMBNAIL_WIDTH)
+        return None
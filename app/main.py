@@ -1,18 +1,36 @@
+import gc
+import glob
+import json
 import logging
+import os
 from datetime import date
-from typing import Annotated, Literal
-from urllib.parse import quote_plus
+from typing import Annotated
+from urllib.parse import quote_plus, urlencode
 
-from fastapi import FastAPI, HTTPException, Request, Depends, Header
-from fastapi.responses import FileResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
+from fastapi import FastAPI, HTTPException, Request, Response, Depends, Header, Query
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
+from pydantic import BeforeValidator, TypeAdapter
 from sqlalchemy import desc
-from sqlalchemy.sql.expression import func
 from sqlalchemy.orm import Session
 
-from .database import get_db, SWUSet, SWUCard, SWUCardArena, SWUCardAspect, SWUCardTrait, SWUCardKeyword
-from .models import SetModel, CardModel
+from .caching import CachedResponse, ConditionalGetMiddleware, LRUCache, content_version
+from .catalog import FACETS, STATS, Catalog, decode_cursor, encode_cursor
+from .compression import MIN_SIZE, DynamicGZipMiddleware, PrecompressedStaticFiles
+from .database import (
+    current_build_version,
+    engine,
+    get_db,
+    SWUSet,
+    SWUCard,
+    SWUMetadata,
+)
+from .images import MANIFEST_FILE, CardImages
+from .models import SetModel, CardModel, CardBatchModel, CardBatchRequest, FacetCountsModel
+from .prerender import PRERENDER_DIR, PrerenderedMiddleware
+from .search import FuzzyNames, search_card_ids
+from .suggest import Suggestions
+from .timing import ServerTimingMiddleware, TimedJinja2Templates, install_query_hooks
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -26,9 +44,14 @@ app = FastAPI(
     },
     redoc_url=None,
 )
-app.mount("/images", StaticFiles(directory="app/static/images"), name="images")
-app.mount("/css", StaticFiles(directory="app/static/css"), name="css")
-templates = Jinja2Templates(directory="app/templates", trim_blocks=True, lstrip_blocks=True)
+app.mount("/images", PrecompressedStaticFiles(directory="app/static/images"), name="images")
+app.mount("/css", PrecompressedStaticFiles(directory="app/static/css"), name="css")
+templates = TimedJinja2Templates(directory="app/templates", trim_blocks=True, lstrip_blocks=True)
+
+# Opt-in per-request SQL/render timings (Server-Timing header and a JSON log line)
+if os.environ.get("SERVER_TIMING"):
+    install_query_hooks(engine)
+    app.add_middleware(ServerTimingMiddleware)
 
 # Add quote_plus filter to Jinja2 templates
 templates.env.filters["quote_plus"] = quote_plus
@@ -44,47 +67,91 @@ db = session.__next__()
 
 all_sets = db.query(SWUSet).order_by(desc(SWUSet.number)).all()
 
+# Search form options, computed by data/create_db.py
 advanced_search_options = {
     "set_options": [{"id": s.id, "name": s.name} for s in all_sets],
-    "arena_options": [
-        a.arena for a in db.query(SWUCardArena.arena).distinct().order_by(SWUCardArena.arena).all() if a.arena
-    ],
-    "aspect_options": [
-        {"aspect": a.aspect, "color": a.color}
-        for a in db.query(SWUCardAspect.aspect, SWUCardAspect.color, SWUCardAspect.sort_order)
-        .distinct()
-        .order_by(SWUCardAspect.sort_order)
-        .all()
-        if a.aspect
-    ],
-    "trait_options": [
-        t.trait for t in db.query(SWUCardTrait.trait).distinct().order_by(SWUCardTrait.trait).all() if t.trait
-    ],
-    "keyword_options": [
-        k.keyword
-        for k in db.query(SWUCardKeyword.keyword).distinct().order_by(SWUCardKeyword.keyword).all()
-        if k.keyword
-    ],
-    "card_type_options": [
-        c.card_type for c in db.query(SWUCard.card_type).distinct().order_by(SWUCard.card_type).all()
-    ],
-    "rarity_options": [c.rarity for c in db.query(SWUCard.rarity).distinct().order_by(SWUCard.rarity).all()],
-    "artist_options": [
-        c.artist_search for c in db.query(SWUCard.artist_search).distinct().order_by(SWUCard.artist_search).all()
-    ],
-    "variant_type_options": [
-        c.variant_type for c in db.query(SWUCard.variant_type).distinct().order_by(SWUCard.variant_type).all()
-    ],
-    "rotation_options": [
-        s.rotation for s in db.query(SWUSet.rotation).distinct().order_by(SWUSet.rotation).all() if s.rotation
-    ],
+    **json.loads(db.query(SWUMetadata.value).filter(SWUMetadata.key == "search_options").scalar()),
+}
+
+# (value, text) of each option of the search form's dropdowns, by query parameter
+search_select_options = {
+    "aspect": [(a["aspect"], f"{a['aspect']} ({a['color']})") for a in advanced_search_options["aspect_options"]],
+    "set_id": [(s["id"], f"{s['id']} ({s['name']})") for s in advanced_search_options["set_options"]],
+    **{
+        param: [(value, value) for value in advanced_search_options[f"{param}_options"]]
+        for param in ("card_type", "trait", "keyword", "arena", "rarity", "artist", "variant_type", "rotation")
+    },
 }
 
+# Load the whole card catalog ONCE per worker for in-memory filtering
+catalog = Catalog.load(db)
+
+# Trigram index of card names and subtitles, for fuzzy name search
+fuzzy_names = FuzzyNames.load(db)
+
+# Card names and subtitles for autocomplete
+suggestions = Suggestions([card.name for card in catalog.cards] + [c.subtitle for c in catalog.cards if c.subtitle])
+
+# Get the database build version, which identifies the content of every cacheable response
+build_version = db.query(SWUMetadata.value).filter(SWUMetadata.key == "build_version").scalar()
+
 del db
 session.close()
 
+# Don't carry open database connections into forked workers (gunicorn --preload loads the app before forking)
+engine.dispose()
+
 templates.env.globals["all_sets"] = all_sets
 
+# Card image URLs, with responsive renditions if data/fetch_card_images.py has made them
+templates.env.globals["card_images"] = CardImages.load()
+
+# Version of every response rendered from this database build, this app code, these templates and card image
+# renditions (so a deploy that changes any of them changes every ETag)
+response_version = content_version(build_version, *sorted(glob.glob("app/*.py")), "app/templates", MANIFEST_FILE)
+
+# Compress other responses on the fly (pre-rendered pages, cached card lists and static files are already compressed)
+app.add_middleware(DynamicGZipMiddleware, exclude=["/images/", "/css/"], minimum_size=MIN_SIZE)
+
+# Serve pre-rendered pages (see app/prerender.py) when they exist
+app.add_middleware(PrerenderedMiddleware, directory=PRERENDER_DIR, version=response_version)
+
+# Answer conditional GETs of pages and APIs that only change when the database is rebuilt
+app.add_middleware(
+    ConditionalGetMiddleware,
+    version=response_version,
+    paths=["/", "/search", "/card_list", "/facets", "/suggest", "/set_list"],
+    prefixes=["/sets/", "/cards/"],
+    exclude=["/cards/random"],
+)
+
+# Maximum number of cards looked up at once at /cards/batch
+MAX_BATCH_SIZE = 200
+
+# Default and maximum number of /suggest results
+SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 50
+
+# Page sizes for /card_list (htmx requests are always paginated, API requests only if a limit is given)
+HX_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Repeatable query parameter of facet terms: all must match, "a|b" matches either value, and "-a" must not match
+FacetTerms = Annotated[list[str] | None, Query()]
+
+# Integer query parameter where an empty value (such as an empty search form field) means no filter
+OptionalInt = Annotated[int | None, BeforeValidator(lambda value: None if value == "" else value)]
+
+# Rendered /card_list responses (with their compressed variants), keyed by normalized query parameters and
+# whether it is an htmx request, and cleared when the database file's build version changes. Bounded by bytes as well
+# as entries, since an unfiltered list is a few MB.
+CARD_LIST_CACHE_BYTES = 32 * 1024 * 1024
+card_list_cache = LRUCache(maxsize=1024, maxbytes=CARD_LIST_CACHE_BYTES, sizeof=lambda cached: cached.size)
+card_list_adapter = TypeAdapter(list[CardModel])
+
+# Allowed values of the /card_list query parameters that are chosen from the search form's options
+card_list_options = {param: {value for value, _ in options} for param, options in search_select_options.items()}
+
 
 # Define routes
 @app.get("/", include_in_schema=False)
@@ -96,7 +163,11 @@ async def root(request: Request):
 @app.get("/search", include_in_schema=False)
 async def search(request: Request, db: Session = Depends(get_db)):
     """Return the search page (form and results) at /search"""
-    search_context = {"has_query_params": len(request.query_params) > 0, **advanced_search_options}
+    search_context = {
+        "has_query_params": len(request.query_params) > 0,
+        "select_options": search_select_options,
+        **advanced_search_options,
+    }
     return templates.TemplateResponse(request=request, name="search.html", context=search_context)
 
 
@@ -109,28 +180,38 @@ async def get_set_page(request: Request, set_id: str, db: Session = Depends(get_
     return templates.TemplateResponse(request=request, name="set.html", context={"set": swu_set})
 
 
+# Declared before /cards/{card_id}, which would otherwise match /cards/batch
+@app.get("/cards/batch", response_model=CardBatchModel)
+async def get_card_batch(ids: str):
+    """Return the SWU cards with the given comma-separated IDs (at most 200) at /cards/batch, in the order given
+    (without repeats), and the IDs that aren't any card's.
+    """
+    return _card_batch([card_id.strip() for card_id in ids.split(",")], ("query", "ids"))
+
+
+@app.post("/cards/batch", response_model=CardBatchModel)
+async def post_card_batch(batch: CardBatchRequest):
+    """Return the SWU cards with the IDs in the request body (at most 200) at /cards/batch, in the order given
+    (without repeats), and the IDs that aren't any card's.
+    """
+    return _card_batch(batch.ids, ("body", "ids"))
+
+
 @app.get("/cards/{card_id}", include_in_schema=False)
 async def get_card_page(request: Request, card_id: str, db: Session = Depends(get_db)):
-    """Return the card page for the given card_id at /cards/{card_id} or a random card at /cards/random"""
+    """Return the card page for the given card_id at /cards/{card_id} or a random card at /cards/random.
+    The random card can be limited to cards matching query parameters such as set_id or variant_type.
+    """
     if card_id.lower() == "random":
-        card = db.query(SWUCard).order_by(func.random()).first()
-        if card:
-            return RedirectResponse(f"/cards/{card.id}", status_code=303)
+        random_card = catalog.random_card(**{facet: request.query_params.getlist(facet) for facet in FACETS})
+        if random_card:
+            return RedirectResponse(f"/cards/{random_card.id}", status_code=303)
+        card = None
     else:
         card = db.query(SWUCard).filter(SWUCard.id == card_id).first()
     if not card:
         raise HTTPException(status_code=404, detail=f"Card '{card_id}' not found")
-    variants = (
-        db.query(SWUCard)
-        .filter(
-            SWUCard.name == card.name,
-            SWUCard.card_type == card.card_type,
-            SWUCard.subtitle == card.subtitle,
-        )
-        .join(SWUCard.card_set)
-        .order_by(SWUSet.number, SWUCard.number)
-        .all()
-    )
+    variants = catalog.variants(card.variant_group_id)
     return templates.TemplateResponse(request=request, name="card.html", context={"card": card, "variants": variants})
 
 
@@ -153,51 +234,285 @@ async def get_cards(
     request: Request,
     db: Session = Depends(get_db),
     hx_request: Annotated[str | None, Header(include_in_schema=False)] = None,
+    accept: Annotated[str | None, Header(include_in_schema=False)] = None,
+    accept_encoding: Annotated[str | None, Header(include_in_schema=False)] = None,
     name: str | None = None,
     text: str | None = None,
-    aspect: Literal["", *(a["aspect"] for a in advanced_search_options["aspect_options"])] | None = None,  # type: ignore
-    card_type: Literal["", *advanced_search_options["card_type_options"]] | None = None,  # type: ignore
-    trait: Literal["", *advanced_search_options["trait_options"]] | None = None,  # type: ignore
-    keyword: Literal["", *advanced_search_options["keyword_options"]] | None = None,  # type: ignore
-    arena: Literal["", *advanced_search_options["arena_options"]] | None = None,  # type: ignore
-    set_id: Literal["", *(s["id"] for s in advanced_search_options["set_options"])] | None = None,  # type: ignore
-    rarity: Literal["", *advanced_search_options["rarity_options"]] | None = None,  # type: ignore
-    artist: Literal["", *advanced_search_options["artist_options"]] | None = None,  # type: ignore
-    variant_type: Literal["", *advanced_search_options["variant_type_options"]] | None = None,  # type: ignore
-    rotation: Literal["", *advanced_search_options["rotation_options"]] | None = None,  # type: ignore
+    aspect: FacetTerms = None,
+    card_type: FacetTerms = None,
+    trait: FacetTerms = None,
+    keyword: FacetTerms = None,
+    arena: FacetTerms = None,
+    set_id: FacetTerms = None,
+    rarity: FacetTerms = None,
+    artist: str | None = None,
+    variant_type: FacetTerms = None,
+    rotation: FacetTerms = None,
+    cost_min: OptionalInt = None,
+    cost_max: OptionalInt = None,
+    power_min: OptionalInt = None,
+    power_max: OptionalInt = None,
+    hp_min: OptionalInt = None,
+    hp_max: OptionalInt = None,
+    limit: Annotated[int | None, Query(ge=1, le=MAX_PAGE_SIZE)] = None,
+    cursor: str | None = None,
+    facet_counts: Annotated[bool, Query(include_in_schema=False)] = False,
 ):
     """Return an array of all SWU cards matching the query parameters at /card_list.
-    If hx-request header is present, return the card_list.html template.
+    Facet parameters (all but name, text and artist) can be repeated, and every term must match: a term with
+    values separated by "|" matches any of them, and a term starting with "-" must not match. For example,
+    aspect=Vigilance&aspect=Villainy&trait=-JEDI&set_id=SOR|SHD.
+    If no card name or subtitle contains every term of name, cards with similar names that match the other parameters
+    are returned instead (the closest names' cards first, by trigram similarity), with an X-Fuzzy-Match header.
+    Cost, power and HP ranges (such as cost_max=3&power_min=4) are inclusive, and only match cards with that stat:
+    a pilot's own power and HP as a unit, or the modifier an upgrade gives.
+    If limit is given, return at most that many cards, with a Link header (rel="next") to the following page.
+    The Link header also points (rel="facets") to the result counts of each search option at /facets.
+    If the Accept header is application/x-ndjson, stream the cards as newline-delimited JSON instead.
+    If hx-request header is present, return the card_list.html template (paginated, with infinite scroll), and
+    if facet_counts is true, the search form's dropdowns with their result counts (swapped out-of-band).
     """
-    cards = db.query(SWUCard)
-    if set_id:
-        cards = cards.filter(SWUCard.set_id == set_id)
-    if rotation:
-        cards = cards.filter(SWUSet.rotation == rotation)
-    if variant_type:
-        cards = cards.filter(SWUCard.variant_type == variant_type)
-    if card_type:
-        cards = cards.filter(SWUCard.card_type == card_type)
-    if rarity:
-        cards = cards.filter(SWUCard.rarity == rarity)
-    if artist:
-        cards = cards.filter(SWUCard.artist_search.icontains(artist))
-    if name:
-        cards = cards.filter(SWUCard.name_and_subtitle.icontains(name))
-    if text:
-        cards = cards.filter(SWUCard.card_text.icontains(text))
-    if arena:
-        cards = cards.join(SWUCardArena).filter(SWUCard.arenas.any(SWUCardArena.arena == arena))
-    if aspect:
-        cards = cards.join(SWUCardAspect).filter(SWUCard.aspects.any(SWUCardAspect.aspect == aspect))
-    if trait:
-        cards = cards.join(SWUCardTrait).filter(SWUCard.traits.any(SWUCardTrait.trait == trait))
-    if keyword:
-        cards = cards.join(SWUCardKeyword).filter(SWUCard.keywords.any(SWUCardKeyword.keyword == keyword))
-    cards = cards.join(SWUCard.card_set).order_by(SWUSet.number, SWUCard.number).all()
+    params = {
+        "name": name,
+        "text": text,
+        "aspect": aspect,
+        "card_type": card_type,
+        "trait": trait,
+        "keyword": keyword,
+        "arena": arena,
+        "set_id": set_id,
+        "rarity": rarity,
+        "artist": artist,
+        "variant_type": variant_type,
+        "rotation": rotation,
+        "cost_min": cost_min,
+        "cost_max": cost_max,
+        "power_min": power_min,
+        "power_max": power_max,
+        "hp_min": hp_min,
+        "hp_max": hp_max,
+        "limit": limit,
+        "cursor": cursor,
+    }
+    params = _query_params(params)
+    if facet_counts:
+        params["facet_counts"] = True
+    _validate_options(params)
+    ndjson = accept is not None and "application/x-ndjson" in accept
+    cache_key = (bool(hx_request), tuple((k, tuple(v) if isinstance(v, list) else v) for k, v in params.items()))
+    if not ndjson and (cached := card_list_cache.get(cache_key, version=current_build_version())):
+        response = cached.response(accept_encoding, headers={"X-Cache": "HIT"})
+        card_list_cache.set(cache_key, cached)  # Re-measure it, in case a compressed variant was just added
+        return response
+
+    facet_values = _facet_values(params)
+    facet_bits = catalog.filter(**facet_values)
+    search_bits, ranked_names = _search_bits(db, params, facet_bits)
+    fuzzy = ranked_names is not None
+    try:
+        after = decode_cursor(cursor, ranked=fuzzy) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e)) from e
+    bits = search_bits & facet_bits
+    if hx_request and limit is None:
+        limit = HX_PAGE_SIZE
+    cards, more = catalog.page(bits, after=after, limit=limit, names=ranked_names)
+    params.pop("facet_counts", None)
+    next_url = None
+    if more:
+        next_cursor = encode_cursor(cards[-1], ranked_names)
+        next_url = f"{request.url.path}?{urlencode({**params, 'cursor': next_cursor}, doseq=True)}"
+    headers = {"X-Fuzzy-Match": "true"} if fuzzy else {}
     if hx_request:
-        return templates.TemplateResponse(request=request, name="card_list.html", context={"cards": cards})
-    return cards
+        context = {"cards": cards, "next_url": next_url, "fuzzy": fuzzy and not cursor}
+        if facet_counts and not cursor:
+            context["facet_counts"] = catalog.facet_counts(search_bits, **facet_values)
+            context["select_options"] = search_select_options
+            context["selected"] = {k: v[0] for k, v in facet_values.items() if v and len(v) == 1}
+        response = templates.TemplateResponse(request=request, name="card_list.html", context=context)
+    else:
+        links = [f'<{next_url}>; rel="next"'] if next_url else []
+        facets_params = urlencode({k: v for k, v in params.items() if k not in ("limit", "cursor")}, doseq=True)
+        links.append(f'</facets{"?" if facets_params else ""}{facets_params}>; rel="facets"')
+        headers["Link"] = ", ".join(links)
+        if ndjson:
+            return StreamingResponse(_iter_ndjson(cards), media_type="application/x-ndjson", headers=headers)
+        body = card_list_adapter.dump_json(card_list_adapter.validate_python(cards, from_attributes=True))
+        response = Response(content=body, media_type="application/json", headers=headers)
+    cached = CachedResponse(response.body, response.media_type, headers)
+    response = cached.response(accept_encoding, headers={"X-Cache": "MISS"})
+    card_list_cache.set(cache_key, cached)
+    return response
+
+
+@app.get("/facets", response_model=FacetCountsModel)
+async def get_facets(
+    db: Session = Depends(get_db),
+    name: str | None = None,
+    text: str | None = None,
+    aspect: FacetTerms = None,
+    card_type: FacetTerms = None,
+    trait: FacetTerms = None,
+    keyword: FacetTerms = None,
+    arena: FacetTerms = None,
+    set_id: FacetTerms = None,
+    rarity: FacetTerms = None,
+    artist: str | None = None,
+    variant_type: FacetTerms = None,
+    rotation: FacetTerms = None,
+    cost_min: OptionalInt = None,
+    cost_max: OptionalInt = None,
+    power_min: OptionalInt = None,
+    power_max: OptionalInt = None,
+    hp_min: OptionalInt = None,
+    hp_max: OptionalInt = None,
+):
+    """Return the number of SWU cards matching the query parameters (as in /card_list) at /facets, and for each
+    value of the aspect, trait, keyword, arena, card_type, rarity, set_id and variant_type parameters, the number
+    of cards that choosing it (instead of the current value of that parameter) would give.
+    """
+    params = {
+        "name": name,
+        "text": text,
+        "aspect": aspect,
+        "card_type": card_type,
+        "trait": trait,
+        "keyword": keyword,
+        "arena": arena,
+        "set_id": set_id,
+        "rarity": rarity,
+        "artist": artist,
+        "variant_type": variant_type,
+        "rotation": rotation,
+        "cost_min": cost_min,
+        "cost_max": cost_max,
+        "power_min": power_min,
+        "power_max": power_max,
+        "hp_min": hp_min,
+        "hp_max": hp_max,
+    }
+    params = _query_params(params)
+    _validate_options(params)
+    facet_values = _facet_values(params)
+    facet_bits = catalog.filter(**facet_values)
+    search_bits, _ = _search_bits(db, params, facet_bits)
+    return {
+        "total": (search_bits & facet_bits).bit_count(),
+        "facets": catalog.facet_counts(search_bits, **facet_values),
+    }
+
+
+@app.get("/suggest", response_model=list[str])
+async def get_suggestions(
+    request: Request,
+    hx_request: Annotated[str | None, Header(include_in_schema=False)] = None,
+    q: str = "",
+    name: Annotated[str, Query(include_in_schema=False)] = "",
+    limit: Annotated[int, Query(ge=1, le=MAX_SUGGEST_LIMIT)] = SUGGEST_LIMIT,
+):
+    """Return an array of up to limit distinct card names and subtitles starting with q (or with a later word
+    starting with it), ignoring case, accents and punctuation, at /suggest.
+    If hx-request header is present, return the suggestions.html template (the options of a datalist), for the
+    search forms' name fields (which send their value as name instead of q).
+    """
+    names = suggestions.suggest(q or name, limit)
+    if hx_request:
+        return templates.TemplateResponse(request=request, name="suggestions.html", context={"names": names})
+    return names
+
+
+def _card_batch(card_ids: list[str], loc: tuple[str, str]) -> dict:
+    """Look up cards by ID in the in-memory catalog (which holds every card with its child rows), or raise a
+    validation error (422) if there are too many IDs
+    """
+    card_ids = list(dict.fromkeys(card_id for card_id in card_ids if card_id))
+    if len(card_ids) > MAX_BATCH_SIZE:
+        raise RequestValidationError(
+            [
+                {
+                    "type": "too_long",
+                    "loc": loc,
+                    "msg": f"List should have at most {MAX_BATCH_SIZE} items, not {len(card_ids)}",
+                    "input": card_ids,
+                }
+            ]
+        )
+    cards, missing = catalog.find(card_ids)
+    return {"cards": cards, "missing": missing}
+
+
+def _query_params(params: dict) -> dict:
+    """Return the given query parameters without empty values (or empty facet terms)"""
+    params = {k: [term for term in v if term] if isinstance(v, list) else v for k, v in params.items()}
+    return {k: v for k, v in params.items() if v is not None and v != "" and v != []}
+
+
+def _validate_options(params: dict):
+    """Raise a validation error (422) if a query parameter (or facet term) chosen from the search form's options
+    isn't one of them
+    """
+    for param, allowed in card_list_options.items():
+        value = params.get(param)
+        if isinstance(value, list):
+            values = [option for term in value for option in term.removeprefix("-").split("|")]
+        else:
+            values = [value] if value else []
+        for option in values:
+            if option not in allowed:
+                raise RequestValidationError(
+                    [
+                        {
+                            "type": "literal_error",
+                            "loc": ("query", param),
+                            "msg": f"Input should be one of the {param} search options",
+                            "input": option,
+                        }
+                    ]
+                )
+
+
+def _facet_values(params: dict) -> dict[str, list[str] | None]:
+    """Return the query parameters' terms that are matched exactly against the catalog's facets"""
+    return {facet: params.get(facet) for facet in FACETS if facet != "artist"}
+
+
+def _search_bits(db: Session, params: dict, facet_bits: int) -> tuple[int, list[str] | None]:
+    """Return the bitset of cards matching the artist, name, text and cost/power/HP range query parameters, and if
+    the name matched fuzzily, the similar folded names, best first.
+
+    The name only matches fuzzily if no card name or subtitle contains it, and cards with similar names match every
+    other parameter (and the facets' bitset); otherwise an unmatched name just matches nothing.
+    """
+    bits = catalog.all_bits
+    for stat in STATS:
+        minimum, maximum = params.get(f"{stat}_min"), params.get(f"{stat}_max")
+        if minimum is not None or maximum is not None:
+            bits &= catalog.stat_range(stat, minimum, maximum)
+    if artist := params.get("artist"):
+        bits &= catalog.contains("artist", artist)
+    text = params.get("text")
+    if name := params.get("name"):
+        card_ids = search_card_ids(db, name=name, text=text)
+        if (
+            not card_ids
+            and not (text and search_card_ids(db, name=name))
+            and (names := fuzzy_names.match(name))
+        ):
+            fuzzy_bits = bits & catalog.bits_for_names(names)
+            if (text_ids := search_card_ids(db, text=text)) is not None:
+                fuzzy_bits &= catalog.bits_for_ids(text_ids)
+            if fuzzy_bits & facet_bits:
+                return fuzzy_bits, names
+    else:
+        card_ids = search_card_ids(db, text=text)
+    if card_ids is not None:
+        bits &= catalog.bits_for_ids(card_ids)
+    return bits, None
+
+
+def _iter_ndjson(cards: list[SWUCard]):
+    for card in cards:
+        yield CardModel.model_validate(card, from_attributes=True).model_dump_json() + "\n"
 
 
 @app.get("/favicon.ico", include_in_schema=False)
@@ -216,4 +531,9 @@ async def get_robots():
 @app.exception_handler(404)
 async def not_found_exception_handler(request: Request, exc: HTTPException):
     """Return the 404 template for missing pages"""
-    return templates.TemplateResponse(request=request, name="404.html", context={})
+    return templates.TemplateResponse(request=request, name="404.html", context={}, status_code=404)
+
+
+# Everything loaded at startup lives as long as the worker: with gunicorn --preload, keep the garbage collector from
+# touching (and so copying) the objects that the forked workers share
+gc.freeze()
@@ -48,3 +48,17 @@ class CardModel(BaseModel):
     arenas: list[ArenaModel]
     traits: list[TraitModel]
     keywords: list[KeywordModel]
+
+
+class FacetCountsModel(BaseModel):
+    total: int
+    facets: dict[str, dict[str, int]]
+
+
+class CardBatchRequest(BaseModel):
+    ids: list[str]
+
+
+class CardBatchModel(BaseModel):
+    cards: list[CardModel]
+    missing: list[str]
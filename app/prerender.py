@@ -0,0 +1,180 @@
+"""Pre-render every card page, set page and set card list to static files, in parallel worker processes.
+
+Run from the repository root (after building the database): python -m app.prerender [--workers N]
+
+The app serves these files (when they match the current database build and templates) instead of rendering the
+same pages dynamically, and falls back to dynamic rendering for everything else. Run python -m app.compression
+afterwards to precompress them.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import html
+import multiprocessing
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qsl, urlencode
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .compression import precompressed_file_response
+
+PRERENDER_DIR = "app/prerendered"
+VERSION_FILE = "VERSION"
+
+# Pages under these paths are pre-rendered as {directory}/{id}.html
+PAGE_PREFIXES = {"/cards/": "cards", "/sets/": "sets"}
+PAGE_ID_PATTERN = re.compile(r"[\w-]+")
+NEXT_PAGE_PATTERN = re.compile(r'hx-get="(/card_list\?[^"]+)"')
+
+
+def prerendered_file(path: str, query: str, hx_request: bool) -> str | None:
+    """Return the (relative) file a request would be pre-rendered to, or None if it is never pre-rendered"""
+    for prefix, directory in PAGE_PREFIXES.items():
+        if path.startswith(prefix):
+            page_id = path[len(prefix) :]
+            if hx_request or query or not PAGE_ID_PATTERN.fullmatch(page_id):
+                return None
+            return f"{directory}/{page_id}.html"
+    if path == "/card_list" and hx_request:
+        params = urlencode(sorted((k, v) for k, v in parse_qsl(query) if v))
+        return f"card_list/{hashlib.sha1(params.encode('utf-8')).hexdigest()}.html"
+    return None
+
+
+class PrerenderedMiddleware:
+    """Serve pre-rendered pages from `directory`, if it was rendered from the current content version"""
+
+    def __init__(self, app: ASGIApp, directory: str, version: str):
+        self.app = app
+        self.directory = directory
+        self.files: set[str] = set()
+        try:
+            with open(os.path.join(directory, VERSION_FILE)) as f:
+                rendered_version = f.read().strip()
+        except FileNotFoundError:
+            return
+        if rendered_version == version:
+            for root, _, files in os.walk(directory):
+                self.files.update(os.path.relpath(os.path.join(root, name), directory) for name in files)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http" and self.files and scope["method"] in ("GET", "HEAD"):
+            headers = Headers(scope=scope)
+            file = prerendered_file(
+                scope["path"], scope["query_string"].decode("latin-1"), headers.get("hx-request") is not None
+            )
+            if file in self.files:
+                path = os.path.join(self.directory, file)
+                response = precompressed_file_response(path, scope, media_type="text/html")
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+async def _get(app: ASGIApp, url: str, hx_request: bool = False) -> bytes:
+    """Render a GET request through the app, without a server"""
+    path, _, query = url.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("utf-8"),
+        "query_string": query.encode("latin-1"),
+        "root_path": "",
+        "headers": [(b"hx-request", b"true")] if hx_request else [],
+        "client": ("127.0.0.1", 0),
+        "server": ("localhost", 80),
+    }
+    status = None
+    chunks = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    if status != 200:
+        raise RuntimeError(f"GET {url} returned {status}")
+    return b"".join(chunks)
+
+
+def _write(out_dir: str, url: str, hx_request: bool, body: bytes):
+    path, _, query = url.partition("?")
+    file = os.path.join(out_dir, prerendered_file(path, query, hx_request))  # type: ignore
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    with open(file, "wb") as f:
+        f.write(body)
+
+
+async def _render_all(out_dir: str, page_urls: list[str], card_list_urls: list[str]) -> int:
+    from .main import app
+
+    count = 0
+    for url in page_urls:
+        _write(out_dir, url, False, await _get(app, url))
+        count += 1
+    for url in card_list_urls:
+        # Follow the infinite scroll to pre-render every page of the list
+        while url:
+            body = await _get(app, url, hx_request=True)
+            _write(out_dir, url, True, body)
+            count += 1
+            next_page = NEXT_PAGE_PATTERN.search(body.decode("utf-8"))
+            url = html.unescape(next_page.group(1)) if next_page else None
+    return count
+
+
+def _render_chunk(out_dir: str, page_urls: list[str], card_list_urls: list[str]) -> int:
+    return asyncio.run(_render_all(out_dir, page_urls, card_list_urls))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    args = parser.parse_args()
+
+    # Start from scratch, so the app (also imported by the workers) doesn't serve the old files
+    if os.path.exists(PRERENDER_DIR):
+        shutil.rmtree(PRERENDER_DIR)
+    tmp_dir = f"{PRERENDER_DIR}.tmp"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+
+    from .main import all_sets, catalog, response_version
+
+    page_urls = [f"/cards/{card.id}" for card in catalog.cards] + [f"/sets/{s.id}" for s in all_sets]
+    card_list_urls = [f"/card_list?set_id={s.id}&variant_type=Normal" for s in all_sets]
+    print(f"Pre-rendering {len(page_urls):,} pages and {len(card_list_urls):,} set card lists...")
+
+    start = time.perf_counter()
+    n = args.workers
+    with ProcessPoolExecutor(n, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [
+            executor.submit(_render_chunk, tmp_dir, page_urls[i::n], card_list_urls[i::n]) for i in range(n)
+        ]
+        count = sum(future.result() for future in futures)
+
+    with open(os.path.join(tmp_dir, VERSION_FILE), "w") as f:
+        f.write(response_version)
+    os.rename(tmp_dir, PRERENDER_DIR)
+    print(f"Pre-rendered {count:,} files to {PRERENDER_DIR} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import re
+from collections import Counter, defaultdict
+from collections.abc import Iterable
+
+from sqlalchemy.orm import Session
+
+from .suggest import fold
+
+# Columns of the card_search FTS5 table (built by data/create_db.py) searched by each query parameter
+NAME_COLUMNS = ("name", "subtitle")
+TEXT_COLUMNS = ("front_text", "epic_action", "back_text")
+
+# The trigram tokenizer can only use its index for terms of at least 3 characters
+MIN_MATCH_LENGTH = 3
+
+# "Quoted phrases" or bare words (a trailing * is accepted but redundant, since every term matches as a substring)
+TERM_PATTERN = re.compile(r'"([^"]+)"|([^\s"]+)')
+
+# Fuzzy name matches need at least this share of the query's trigrams, and at most this many names are matched
+FUZZY_THRESHOLD = 0.6
+FUZZY_LIMIT = 20
+
+
+def search_terms(value: str) -> list[str]:
+    """Split a search string into phrases and words"""
+    terms = []
+    for phrase, word in TERM_PATTERN.findall(value):
+        term = (phrase or word.rstrip("*")).strip()
+        if term:
+            terms.append(term)
+    return terms
+
+
+def search_card_ids(db: Session, name: str | None = None, text: str | None = None) -> set[str] | None:
+    """Return the IDs of cards whose name/subtitle contain every term of `name` and whose card text contains every
+    term of `text` (case-insensitive), using the card_search trigram index. Return None if there is nothing to search.
+    """
+    match_terms = []
+    conditions = []
+    params = []
+    for value, columns in ((name, NAME_COLUMNS), (text, TEXT_COLUMNS)):
+        for term in search_terms(value or ""):
+            if len(term) >= MIN_MATCH_LENGTH:
+                match_terms.append(f'{{{" ".join(columns)}}} : "{term.replace('"', '""')}"')
+            else:
+                # Too short for the trigram index, so fall back to scanning the indexed columns
+                like = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                conditions.append("(" + " OR ".join(f"{c} LIKE ? ESCAPE '\\'" for c in columns) + ")")
+                params.extend(like for _ in columns)
+    if match_terms:
+        conditions.insert(0, "card_search MATCH ?")
+        params.insert(0, " AND ".join(match_terms))
+    if not conditions:
+        return None
+    rows = db.connection().exec_driver_sql(
+        f"SELECT card_id FROM card_search WHERE {' AND '.join(conditions)}", tuple(params)
+    )
+    return {row.card_id for row in rows}
+
+
+def trigrams(text: str) -> set[str]:
+    """Return the trigrams of each word of the folded text, padded like PostgreSQL's pg_trgm (two spaces before each
+    word and one after), so the starts and ends of words weigh more
+    """
+    result = set()
+    for word in fold(text).split():
+        padded = f"  {word} "
+        result.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+class FuzzyNames:
+    """Trigram index of cards' folded names and subtitles (the name_trigrams table built by data/create_db.py), for
+    typo-tolerant name search.
+
+    Candidates are only the names sharing a trigram with the query, found through each trigram's posting list.
+    They're ranked by the share of the query's trigrams they contain (so a query can match part of a name), then by
+    their trigram similarity (so closer and shorter names come first).
+    """
+
+    def __init__(self, rows: Iterable[tuple[str, str]]):
+        self.postings: dict[str, list[str]] = defaultdict(list)
+        self.sizes: Counter[str] = Counter()
+        for trigram, name in rows:
+            self.postings[trigram].append(name)
+            self.sizes[name] += 1
+
+    @classmethod
+    def load(cls, db: Session) -> "FuzzyNames":
+        return cls(db.connection().exec_driver_sql("SELECT trigram, name_search FROM name_trigrams").all())
+
+    def match(self, query: str, limit: int = FUZZY_LIMIT, threshold: float = FUZZY_THRESHOLD) -> list[str]:
+        """Return up to `limit` folded names (name_search values) matching the query, best first"""
+        query_trigrams = trigrams(query)
+        shared: Counter[str] = Counter()
+        for trigram in query_trigrams:
+            shared.update(self.postings.get(trigram, ()))
+        scored = []
+        for name, count in shared.items():
+            coverage = count / len(query_trigrams)
+            if coverage >= threshold:
+                similarity = count / (len(query_trigrams) + self.sizes[name] - count)
+                scored.append((-coverage, -similarity, name))
+        scored.sort()
+        return [name for _, _, name in scored[:limit]]
@@ -0,0 +1,52 @@
+import re
+import unicodedata
+from bisect import bisect_left
+from collections.abc import Iterable
+
+# Apostrophes are dropped when folding (so "Han Solo's" matches "han solos"), other punctuation separates words
+APOSTROPHE_PATTERN = re.compile(r"['’]")
+SEPARATOR_PATTERN = re.compile(r"[\W_]+")
+
+
+def fold(text: str) -> str:
+    """Return text without diacritics or punctuation, in lowercase, with words separated by single spaces.
+
+    This mirrors the unidecode folding of artist names in data/create_db.py, with the standard library (unidecode
+    is only a build dependency), so typed names match whether or not they have accents ("padme", "Padmé").
+    """
+    text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    text = APOSTROPHE_PATTERN.sub("", text.casefold())
+    return SEPARATOR_PATTERN.sub(" ", text).strip()
+
+
+class Suggestions:
+    """Prefix index of card names and subtitles, for autocomplete.
+
+    Each distinct name or subtitle is kept under its folded text in one sorted array, and under the folded text
+    from each of its later words in another, so a prefix lookup is a binary search and a scan of only the matches
+    it returns. Texts starting with the prefix come first, then texts with a later word starting with it, each in
+    alphabetical order.
+    """
+
+    def __init__(self, texts: Iterable[str]):
+        starts = set()
+        word_starts = set()
+        for text in set(texts):
+            key = fold(text)
+            starts.add((key, text))
+            word_starts.update((key[m.end() :], text) for m in re.finditer(" ", key))
+        self.tiers = [sorted(starts), sorted(word_starts)]
+        self.keys = [[key for key, _ in tier] for tier in self.tiers]
+
+    def suggest(self, query: str, limit: int = 10) -> list[str]:
+        """Return up to `limit` distinct names and subtitles matching the start of the query (or of a later word)"""
+        prefix = fold(query)
+        if not prefix:
+            return []
+        results: dict[str, None] = {}
+        for keys, tier in zip(self.keys, self.tiers):
+            i = bisect_left(keys, prefix)
+            while i < len(keys) and len(results) < limit and keys[i].startswith(prefix):
+                results[tier[i][1]] = None
+                i += 1
+        return list(results)
@@ -0,0 +1,103 @@
+import json
+import logging
+import time
+from contextvars import ContextVar
+
+from fastapi.templating import Jinja2Templates
+from sqlalchemy import Engine, event
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTiming:
+    """SQL and template rendering statistics for a single request"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+
+
+_current_timing: ContextVar[RequestTiming | None] = ContextVar("current_timing", default=None)
+
+
+def install_query_hooks(engine: Engine):
+    """Count and time every statement executed on the engine, against the current request (if any)"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_times", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start_times"].pop()
+        if timing := _current_timing.get():
+            timing.queries += 1
+            timing.db_seconds += elapsed
+
+
+class TimedJinja2Templates(Jinja2Templates):
+    """Jinja2Templates that records how long each template takes to render, against the current request (if any)"""
+
+    def TemplateResponse(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().TemplateResponse(*args, **kwargs)
+        finally:
+            if timing := _current_timing.get():
+                timing.render_seconds += time.perf_counter() - start
+
+
+class ServerTimingMiddleware:
+    """Report each request's query count, SQL time, template render time and total time.
+
+    The timings are added to the response as a Server-Timing header and logged as a single JSON line.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming()
+        token = _current_timing.set(timing)
+        start = time.perf_counter()
+        status_code = None
+
+        async def send_with_timing(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                total_ms = (time.perf_counter() - start) * 1000
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Server-Timing",
+                    f'db;dur={timing.db_seconds * 1000:.2f};desc="{timing.queries} queries", '
+                    f"render;dur={timing.render_seconds * 1000:.2f}, "
+                    f"total;dur={total_ms:.2f}",
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_timing.reset(token)
+            logger.info(
+                json.dumps(
+                    {
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "query": scope["query_string"].decode("latin-1"),
+                        "status": status_code,
+                        "queries": timing.queries,
+                        "db_ms": round(timing.db_seconds * 1000, 2),
+                        "render_ms": round(timing.render_seconds * 1000, 2),
+                        "total_ms": round((time.perf_counter() - start) * 1000, 2),
+                    }
+                )
+            )
@@ -0,0 +1,274 @@
+"""Frozen copy of htmlify_card_text (app/card_text.py) before the trait/keyword vocabulary was built once per
+process, for benchmarks/render_card_text.py to time against. Not used by the app.
+"""
+
+import re
+from urllib.parse import quote_plus
+
+
+def _bold(text: str) -> str:
+    return f"<b>{text}</b>"
+
+
+def _italic(text: str) -> str:
+    return f"<i>{text}</i>"
+
+
+def _span(text: str, classes: str, aria_desc: str | None = None) -> str:
+    return f'<span class="{classes}" {f'aria-description="{aria_desc}"' if aria_desc else ""}>{text}</span>'
+
+
+def _image(src: str, alt: str, classes: str | None = None) -> str:
+    return f'<img src="{src}" alt="{alt}" {f'class="{classes}"' if classes else ""}>'
+
+
+def _link(text: str, href: str, classes: str | None = None) -> str:
+    return f'<a href="{href}" {f'class="{classes}"' if classes else ""}>{text}</a>'
+
+
+def clean_punctuation(text: str) -> str:
+    text = re.sub(r'"(.+)"', lambda x: f"“{x.group(1)}”", text)
+    text = re.sub(r" - ", " — ", text)
+    text = re.sub(r"'", "’", text)
+    text = re.sub(r"\.\.\.", "…", text)
+    text = re.sub(r" (-|–)(\d+)/", lambda x: f" −{x.group(2)}/", text)
+    text = re.sub(r"/(-|–)(\d+)", lambda x: f"/−{x.group(2)}", text)
+    return text
+
+
+def htmlify_card_text(
+    text: str, variant_type: str, keywords: list[str], all_traits: list[str], is_pilot: bool = False
+) -> str:
+    """Format a card's text (one side or its epic action) as HTML, with links to traits, keywords and aspects"""
+    # Initalize multi-line flags
+    pilot_text_start_line = None
+
+    lines = text.strip().split("\n")
+    for i, line in enumerate(lines):
+        # Initialize flags
+        full_sentinel = False
+        conditional_sentinel = False
+
+        # Punctuation cleanup
+        line = clean_punctuation(line)
+
+        # Bold action/trigger text
+        line = re.sub(r"Epic Action:", lambda x: _bold(x.group(0)), line)
+        line = re.sub(r"Action(?: \[.+\])?:", lambda x: _bold(x.group(0)), line)
+        line = re.sub(r"When [^.:]+:", lambda x: _bold(x.group(0)), line)
+        line = re.sub(r"On [^.:]+:", lambda x: _bold(x.group(0)), line)
+
+        # Replace text with appropriate symbols/images
+        line = re.sub(
+            r"(\[.*)Exhaust(.*\])",
+            lambda x: (
+                f"{x.group(1)}{_image('/images/icons/exhaust.svg', 'Exhaust', classes='exhaust')}{x.group(2)}"
+            ),
+            line,
+            flags=re.IGNORECASE,
+        )
+        line = re.sub(
+            r"(Aggression|Command|Cunning|Heroism|Vigilance|Villainy)",
+            lambda x: _link(
+                _image(f"/images/aspects/{x.group(1)}-small.png", alt=x.group(1), classes="aspect-img"),
+                f"/search?aspect={x.group(1)}&variant_type=Normal",
+            ),
+            line,
+            flags=re.IGNORECASE,
+        )
+        line = re.sub(
+            r"(non-)?(unique)( \((?:non-)?unique\))",
+            lambda x: (
+                f"{x.group(1) if x.group(1) else ''}{_span('✧', classes='unique', aria_desc='Unique')}{x.group(3)}"
+            ),
+            line,
+            flags=re.IGNORECASE,
+        )
+
+        # Italicize reminder text on Normal variants, hide it on others
+        line = re.sub(
+            r"( ?\(.+?\))",
+            lambda x: _span(x.group(1), classes="reminder") if variant_type == "Normal" else "",
+            line,
+        )
+
+        # Italicize and uppercase "trait"/"traits" in text (unless preceded by a specific trait)
+        not_specific_trait = "".join(f"(?<!{t} )" for t in all_traits)
+        line = re.sub(
+            rf"{not_specific_trait}traits?",
+            lambda x: _span(x.group(0), classes="trait"),
+            line,
+            flags=re.IGNORECASE,
+        )
+
+        # Bold and uppercase "keyword"/"keywords" in text (unless preceded by a specific keyword)
+        not_specific_kw = "".join(f"(?<!{k} )" for k in keywords)
+        line = re.sub(
+            rf"{not_specific_kw}keywords?",
+            lambda x: _span(x.group(0), classes="keyword"),
+            line,
+            flags=re.IGNORECASE,
+        )
+
+        # Add keyword links, flag SENTINEL/PILOTING lines
+        if keywords:
+            for keyword in keywords:
+                if keyword == "SENTINEL":
+                    if line.startswith(keyword) or line.startswith(f"Attached unit gains {keyword}"):
+                        full_sentinel = True
+                    elif re.search(rf"(?:this|attached) unit [^.]*gains [^.]*{keyword}", line, flags=re.IGNORECASE):
+                        conditional_sentinel = True
+                elif keyword == "PILOTING":
+                    if line.startswith(keyword):
+                        pilot_text_start_line = i
+                line = re.sub(
+                    rf"({keyword})( \d+)?( \[.+\])?",
+                    lambda x: _span(
+                        f"{_link(x.group(1) + (x.group(2) or ''), f'/search?keyword={x.group(1)}&variant_type=Normal')}{x.group(3) or ''}",
+                        classes="keyword",
+                    ),
+                    line,
+                )
+                line = re.sub(
+                    r"BOUNTIES",
+                    _link("BOUNTIES", "/search?keyword=BOUNTY&variant_type=Normal", classes="keyword"),
+                    line,
+                )
+
+        # Check for pilot upgrade text
+        if (
+            is_pilot
+            and pilot_text_start_line is None
+            and re.search(r"(attached unit|this upgrade)", line, flags=re.IGNORECASE)
+        ):
+            pilot_text_start_line = i
+
+        # Add trait links
+        TRAIT_GRP = "|".join(all_traits)
+        line = re.sub(
+            rf"({TRAIT_GRP})?(?:, )?({TRAIT_GRP})(,? and |,? or | non-)({TRAIT_GRP})",
+            lambda x: (
+                (
+                    _link(
+                        x.group(1).upper(),
+                        f"/search?trait={quote_plus(x.group(1).upper())}&variant_type=Normal",
+                        classes="trait",
+                    )
+                    + ", "
+                    if x.group(1)
+                    else ""
+                )
+                + _link(
+                    x.group(2).upper(),
+                    f"/search?trait={quote_plus(x.group(2).upper())}&variant_type=Normal",
+                    classes="trait",
+                )
+                + x.group(3)
+                + _link(
+                    x.group(4).upper(),
+                    f"/search?trait={quote_plus(x.group(4).upper())}&variant_type=Normal",
+                    classes="trait",
+                )
+            ),
+            line,
+            flags=re.IGNORECASE,
+        )
+        line = re.sub(
+            rf"({TRAIT_GRP})((?: ground| space| leader)? (?:unit|card|event))",
+            lambda x: (
+                f"{_link(x.group(1).upper(), f'/search?trait={quote_plus(x.group(1).upper())}&variant_type=Normal', classes='trait')}{x.group(2)}"
+            ),
+            line,
+            flags=re.IGNORECASE,
+        )
+        line = re.sub(
+            rf"(attached unit is (?:a |an )?)({TRAIT_GRP})",
+            lambda x: (
+                f"{x.group(1)}{_link(x.group(2).upper(), f'/search?trait={quote_plus(x.group(2).upper())}&variant_type=Normal', classes='trait')}"
+            ),
+            line,
+            flags=re.IGNORECASE,
+        )
+        line = re.sub(
+            rf"(if it’s (?:a |an )?)({TRAIT_GRP})",
+            lambda x: (
+                f"{x.group(1)}{_link(x.group(2).upper(), f'/search?trait={quote_plus(x.group(2).upper())}&variant_type=Normal', classes='trait')}"
+            ),
+            line,
+            flags=re.IGNORECASE,
+        )
+        line = re.sub(
+            rf"(search [^.]+ deck for [^.]+ )({TRAIT_GRP})",
+            lambda x: (
+                f"{x.group(1)}{_link(x.group(2).upper(), f'/search?trait={quote_plus(x.group(2).upper())}&variant_type=Normal', classes='trait')}"
+            ),
+            line,
+            flags=re.IGNORECASE,
+        )
+        line = re.sub(
+            rf"({TRAIT_GRP}) trait",
+            lambda x: (
+                f"{_link(x.group(1).upper(), f'/search?trait={quote_plus(x.group(1).upper())}&variant_type=Normal', classes='trait')} trait"
+            ),
+            line,
+            flags=re.IGNORECASE,
+        )
+        line = re.sub(
+            r"(unit without a )(pilot)( on it)",
+            lambda x: (
+                f"{x.group(1)}{_link(x.group(2).upper(), f'/search?trait={quote_plus(x.group(2).upper())}&variant_type=Normal', classes='trait')}{x.group(3)}"
+            ),
+            line,
+            flags=re.IGNORECASE,
+        )
+
+        # Add badges for cost and buffs/debuffs
+        line = re.sub(r"C=(\d+)", lambda x: _span(x.group(1), classes="badge cost"), line, flags=re.IGNORECASE)
+        line = re.sub(
+            r"Action \[(\d+)",
+            lambda x: f"Action [{_span(x.group(1), classes='badge cost')}",
+            line,
+            flags=re.IGNORECASE,
+        )
+        line = re.sub(
+            r"(costs?|pays?) (\d+)",
+            lambda x: f"{x.group(1)} {_span(x.group(2), classes='badge cost')}",
+            line,
+        )
+        line = re.sub(
+            r"([+-–−]?\d+)/([+-–−]?\d+)",
+            lambda x: (
+                f"{_span(x.group(1), classes='badge power')}/{_span(x.group(2), classes='badge hp')}"
+            ),
+            line,
+        )
+        line = re.sub(
+            r"(\d+)(( or (:?less|more)(?: remaining)?)? HP)",
+            lambda x: f"{_span(x.group(1), classes='badge hp')}{x.group(2)}",
+            line,
+        )
+        line = re.sub(
+            r"(\d+)(( or (:?less|more))? power)",
+            lambda x: f"{_span(x.group(1), classes='badge power')}{x.group(2)}",
+            line,
+        )
+
+        # Wrap each line in a <p> tag
+        line = f'<p class="card-text">{line}</p>'
+
+        # Add sentinel decoration
+        if full_sentinel:
+            line = f'<div class="alert alert-danger p-2 mb-1">{line}</div>'
+        elif conditional_sentinel:
+            line = f'<div class="alert alert-danger p-2 mb-1 text-body" style="background: none;">{line}</div>'
+
+        # Add PILOTING decoration
+        if i == pilot_text_start_line:
+            line = f'<div class="alert alert-light p-2 mb-1">{line}'
+
+        lines[i] = line
+
+    formatted_text = "\n".join(line for line in lines if line)
+    if pilot_text_start_line is not None:
+        formatted_text += "</div>"
+    return formatted_text
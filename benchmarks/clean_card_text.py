@@ -0,0 +1,53 @@
+"""Time keyword extraction (clean_card_text in data/create_db.py) over every card in all_cards.json, and check that
+its text and keywords match clean_card_text_expected.json, a frozen fixture generated once (from the same
+all_cards.json and corrections.json) with the implementation that searched each keyword pattern uncompiled.
+
+Run from the repository root: python benchmarks/clean_card_text.py [number of runs]
+"""
+
+import json
+import os
+import sys
+import time
+
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data"))
+sys.path.append(DATA_DIR)
+from create_db import clean_card_text  # noqa: E402
+
+EXPECTED_PATH = os.path.join(os.path.dirname(__file__), "clean_card_text_expected.json")
+FACES = ("front", "back")
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    all_cards = json.load(open(os.path.join(DATA_DIR, "all_cards.json"), "rb"))
+    corrections = json.load(open(os.path.join(DATA_DIR, "corrections.json"), "rb"))
+    for card in all_cards:
+        card.update(corrections.get(f"{card['Set']}-{card['Number']}", {}))
+    texts = [(card.get("FrontText"), card.get("BackText")) for card in all_cards]
+    print(f"Cleaning text of {len(all_cards):,} cards, {runs} times")
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        results = [(clean_card_text(front), clean_card_text(back)) for front, back in texts]
+        timings.append(time.perf_counter() - start)
+    print(f"Best: {min(timings) * 1000:.1f} ms ({min(timings) * 1e6 / len(all_cards):.1f} µs/card)")
+    print(f"Mean: {sum(timings) / len(timings) * 1000:.1f} ms")
+
+    # Golden check against the text and keywords of the implementation before keyword patterns were precompiled
+    expected = json.load(open(EXPECTED_PATH, "rb"))
+    mismatches = []
+    for card, faces in zip(all_cards, results):
+        card_id = f"{card['Set']}-{card['Number']}"
+        actual = {face: {"text": text, "keywords": sorted(keywords)} for face, (text, keywords) in zip(FACES, faces)}
+        if expected.get(card_id) != actual:
+            mismatches.append(card_id)
+    if mismatches:
+        print(f"{len(mismatches):,} cards differ from {os.path.basename(EXPECTED_PATH)}: {', '.join(mismatches[:20])}")
+        sys.exit(1)
+    print(f"Text and keywords of all {len(all_cards):,} cards match {os.path.basename(EXPECTED_PATH)}")
+
+
+if __name__ == "__main__":
+    main()
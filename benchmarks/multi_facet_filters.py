@@ -0,0 +1,148 @@
+"""Time representative multi-value /card_list facet filters (see Catalog.filter) with three plans, and check that
+they all return the same cards in the same order:
+
+- catalog: the app's in-memory bitsets (Catalog.filter and Catalog.cards_for)
+- sql: a single SQL query of INTERSECT/EXCEPT compound selects, one per term
+- join+any: the ORM query the app used before the catalog, a join per child table and an EXISTS subquery per term
+
+Run from the repository root: python benchmarks/multi_facet_filters.py [number of runs]
+"""
+
+import os
+import sys
+import time
+from urllib.parse import parse_qs
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from sqlalchemy import text  # noqa: E402
+
+from app.catalog import Catalog  # noqa: E402
+from app.database import (  # noqa: E402
+    SessionLocal,
+    SWUCard,
+    SWUCardArena,
+    SWUCardAspect,
+    SWUCardKeyword,
+    SWUCardTrait,
+    SWUSet,
+)
+
+QUERIES = [
+    "aspect=Vigilance&aspect=Villainy",
+    "aspect=Vigilance&aspect=Villainy&trait=-JEDI",
+    "set_id=SOR|SHD&card_type=Unit&aspect=Command|Cunning",
+    "trait=REBEL&trait=VEHICLE&arena=Space&variant_type=Normal",
+    "keyword=SENTINEL|SHIELDED&card_type=-Leader&rarity=Common|Uncommon",
+    "aspect=-Heroism&aspect=-Villainy&variant_type=Normal&rotation=B",
+]
+
+# Facet: (table, column) selecting its values' card IDs, for the SQL plan
+SQL_FACETS = {
+    "set_id": ("cards", "set_id"),
+    "rarity": ("cards", "rarity"),
+    "card_type": ("cards", "card_type"),
+    "variant_type": ("cards", "variant_type"),
+    "aspect": ("card_aspects", "aspect"),
+    "trait": ("card_traits", "trait"),
+    "keyword": ("card_keywords", "keyword"),
+    "arena": ("card_arenas", "arena"),
+}
+
+# Facet: (child relationship, child class, column) or card column, for the join+any plan
+ORM_FACETS = {
+    "set_id": SWUCard.set_id,
+    "rarity": SWUCard.rarity,
+    "card_type": SWUCard.card_type,
+    "variant_type": SWUCard.variant_type,
+    "rotation": SWUSet.rotation,
+    "aspect": (SWUCard.aspects, SWUCardAspect, SWUCardAspect.aspect),
+    "trait": (SWUCard.traits, SWUCardTrait, SWUCardTrait.trait),
+    "keyword": (SWUCard.keywords, SWUCardKeyword, SWUCardKeyword.keyword),
+    "arena": (SWUCard.arenas, SWUCardArena, SWUCardArena.arena),
+}
+
+
+def parse_terms(query: str) -> list[tuple[str, bool, list[str]]]:
+    """Return each (facet, negated, values) term of a query string"""
+    return [
+        (facet, term.startswith("-"), term.removeprefix("-").split("|"))
+        for facet, terms in parse_qs(query).items()
+        for term in terms
+    ]
+
+
+def sql_plan(db, query: str) -> list[str]:
+    selects = ["""SELECT "id" FROM cards"""]
+    params = {}
+    for i, (facet, negated, values) in enumerate(parse_terms(query)):
+        placeholders = ", ".join(f":p{i}_{j}" for j in range(len(values)))
+        params.update({f"p{i}_{j}": value for j, value in enumerate(values)})
+        if facet == "rotation":
+            select = (
+                """SELECT cards."id" FROM cards JOIN sets ON sets."id" = cards."set_id" """
+                f"""WHERE sets."rotation" IN ({placeholders})"""
+            )
+        else:
+            table, column = SQL_FACETS[facet]
+            key = "id" if table == "cards" else "card_id"
+            select = f"""SELECT "{key}" FROM {table} WHERE "{column}" IN ({placeholders})"""
+        selects.append(f"{'EXCEPT' if negated else 'INTERSECT'} {select}")
+    sql = (
+        """SELECT cards."id" FROM cards JOIN sets ON sets."id" = cards."set_id" """
+        f"""WHERE cards."id" IN ({" ".join(selects)}) ORDER BY sets."number", cards."number" """
+    )
+    return [card_id for (card_id,) in db.execute(text(sql), params)]
+
+
+def join_any_plan(db, query: str) -> list[str]:
+    cards = db.query(SWUCard).join(SWUCard.card_set)
+    joined = set()
+    for facet, negated, values in parse_terms(query):
+        if isinstance(ORM_FACETS[facet], tuple):
+            relationship, child, column = ORM_FACETS[facet]
+            if negated:
+                cards = cards.filter(~relationship.any(column.in_(values)))
+            else:
+                if child not in joined:  # A table can only be joined once (so far, only one term per facet)
+                    cards = cards.join(child)
+                    joined.add(child)
+                cards = cards.filter(relationship.any(column.in_(values)))
+        else:
+            column = ORM_FACETS[facet]
+            cards = cards.filter(~column.in_(values) if negated else column.in_(values))
+    ids = [card.id for card in cards.order_by(SWUSet.number, SWUCard.number).all()]
+    return list(dict.fromkeys(ids))
+
+
+def catalog_plan(catalog: Catalog, query: str) -> list[str]:
+    return [card.id for card in catalog.cards_for(catalog.filter(**parse_qs(query)))]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    db = SessionLocal()
+    catalog = Catalog.load(db)
+    plans = {
+        "catalog": lambda query: catalog_plan(catalog, query),
+        "sql": lambda query: sql_plan(db, query),
+        "join+any": lambda query: join_any_plan(db, query),
+    }
+    print(f"Running {len(QUERIES)} queries {runs} times with each plan (mean time per query)")
+    for query in QUERIES:
+        results = {name: plan(query) for name, plan in plans.items()}
+        if any(result != results["catalog"] for result in results.values()):
+            print(f"Plans disagree for {query}: {({name: len(result) for name, result in results.items()})}")
+            sys.exit(1)
+        timings = {}
+        for name, plan in plans.items():
+            start = time.perf_counter()
+            for _ in range(runs):
+                plan(query)
+            timings[name] = (time.perf_counter() - start) / runs * 1000
+        print(f"{query} ({len(results['catalog']):,} cards)")
+        print("    " + ", ".join(f"{name}: {ms:.3f} ms" for name, ms in timings.items()))
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Time formatting card text as HTML (SWUCard._htmlify_card_text), per card, over every card in the database, with
+each plan, and check that they render the same HTML:
+
+- vocabulary: the app's trait/keyword vocabulary, built once per process with precompiled patterns
+- baseline: the formatting before it (benchmarks/card_text_baseline.py), which queried every trait and compiled its
+  regexes and lookbehinds on every call
+
+Run from the repository root: python benchmarks/render_card_text.py [number of cards]
+"""
+
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from sqlalchemy.orm import selectinload  # noqa: E402
+
+from app.database import SessionLocal, SWUCard, SWUCardTrait  # noqa: E402
+from card_text_baseline import htmlify_card_text as baseline_htmlify_card_text  # noqa: E402
+
+
+def all_traits() -> list[str]:
+    """Every trait, queried in a new session like the baseline's SWUCard._all_traits did on every call"""
+    db = SessionLocal()
+    try:
+        return [t.trait for t in db.query(SWUCardTrait.trait).distinct().order_by(SWUCardTrait.trait).all() if t.trait]
+    finally:
+        db.close()
+
+
+def baseline_plan(card: SWUCard, text: str, is_pilot: bool = False) -> str:
+    keywords = [k.keyword for k in card.keywords if k.keyword]
+    return baseline_htmlify_card_text(text, card.variant_type, keywords, all_traits(), is_pilot=is_pilot)
+
+
+def vocabulary_plan(card: SWUCard, text: str, is_pilot: bool = False) -> str:
+    return card._htmlify_card_text(text, is_pilot=is_pilot)
+
+
+def render(plan, card: SWUCard) -> list[str]:
+    is_pilot = any(t.trait == "PILOT" for t in card.traits)
+    return [
+        plan(card, card.front_text or "", is_pilot=is_pilot),
+        plan(card, card.back_text or "", is_pilot=is_pilot),
+        plan(card, card.epic_action or ""),
+    ]
+
+
+def main():
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    db = SessionLocal()
+    cards = (
+        db.query(SWUCard)
+        .options(selectinload(SWUCard.traits), selectinload(SWUCard.keywords))
+        .order_by(SWUCard.id)
+        .limit(limit)
+        .all()
+    )
+    print(f"Rendering text of {len(cards):,} cards with each plan")
+
+    plans = {"vocabulary": vocabulary_plan, "baseline": baseline_plan}
+    for name, plan in plans.items():
+        timings = []
+        for card in cards:
+            start = time.perf_counter()
+            html = render(plan, card)
+            timings.append(time.perf_counter() - start)
+            if name != "vocabulary" and html != render(vocabulary_plan, card):
+                print(f"Plans disagree for {card.id}")
+                sys.exit(1)
+
+        timings_ms = sorted(t * 1000 for t in timings)
+        print(name)
+        print(f"    First card: {timings[0] * 1000:.2f} ms")
+        print(f"    Mean: {sum(timings_ms) / len(timings_ms):.3f} ms/card")
+        print(f"    Median: {timings_ms[len(timings_ms) // 2]:.3f} ms/card")
+        print(f"    95th percentile: {timings_ms[int(len(timings_ms) * 0.95)]:.3f} ms/card")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Compare the default and read-only (DATABASE_READ_ONLY) database engines, with a typical mix of page queries run by
+as many worker processes as the Dockerfile's gunicorn workers.
+
+Run from the repository root: python benchmarks/sqlite_read_only.py [requests per worker] [workers]
+"""
+
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.database import SWUCard, SWUSet, make_engine  # noqa: E402
+from app.search import search_card_ids  # noqa: E402
+
+SEARCH_TERMS = ["vader", "luke", "droid", "bounty", "shield", "x-wing", "han solo", "ambush"]
+
+
+def run_worker(read_only: bool, requests: int, seed: int) -> tuple[float, list[float]]:
+    """Run `requests` simulated page requests, each with its own session, and return the total time and the
+    timing of each request
+    """
+    engine = make_engine(read_only)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = session_factory()
+    card_ids = [card_id for (card_id,) in db.query(SWUCard.id)]
+    set_ids = [set_id for (set_id,) in db.query(SWUSet.id)]
+    db.close()
+
+    rng = random.Random(seed)
+    timings = []
+    loop_start = time.perf_counter()
+    for i in range(requests):
+        start = time.perf_counter()
+        db = session_factory()
+        if i % 3 == 0:
+            # Card page: the card with its child rows, and its variants
+            card = db.query(SWUCard).filter(SWUCard.id == rng.choice(card_ids)).one()
+            _ = card.aspects, card.arenas, card.traits, card.keywords, card.card_set
+            db.query(SWUCard).filter(SWUCard.name == card.name, SWUCard.card_type == card.card_type).all()
+        elif i % 3 == 1:
+            # Search by name and text
+            search_card_ids(db, name=rng.choice(SEARCH_TERMS), text=rng.choice(SEARCH_TERMS))
+        else:
+            # Set card list: a summary of every card in the set
+            (
+                db.query(SWUCard.id, SWUCard.name, SWUCard.subtitle, SWUCard.rarity, SWUCard.card_type)
+                .filter(SWUCard.set_id == rng.choice(set_ids))
+                .order_by(SWUCard.number)
+                .all()
+            )
+        db.close()
+        timings.append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - loop_start
+    engine.dispose()
+    return elapsed, timings
+
+
+def run(read_only: bool, requests: int, workers: int) -> tuple[float, list[float]]:
+    """Run every worker in parallel, and return the longest worker's time and all request timings"""
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        results = list(executor.map(run_worker, [read_only] * workers, [requests] * workers, range(workers)))
+    return max(elapsed for elapsed, _ in results), [t for _, timings in results for t in timings]
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    print(f"Running {requests:,} requests in each of {workers} worker processes")
+    for name, read_only in (("default", False), ("read-only", True)):
+        wall, timings = run(read_only, requests, workers)
+        timings_ms = sorted(t * 1000 for t in timings)
+        print(
+            f"{name:>9}: {len(timings) / wall:,.0f} requests/s, "
+            f"mean {sum(timings_ms) / len(timings_ms):.3f} ms, "
+            f"median {timings_ms[len(timings_ms) // 2]:.3f} ms, "
+            f"95th percentile {timings_ms[int(len(timings_ms) * 0.95)]:.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
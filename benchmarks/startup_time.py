@@ -0,0 +1,113 @@
+"""Time how long the app takes to start (importing app.main: loading search options, the card catalog and routes),
+and how long loading the search form's options takes with each plan, checking they load the same options:
+
+- snapshot: the one metadata row of JSON written by data/create_db.py, which the app loads
+- queries: the ten SELECT DISTINCT ... ORDER BY queries the app ran on every start before the snapshot
+
+Run from the repository root: python benchmarks/startup_time.py [number of runs]
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+from app.database import (  # noqa: E402
+    SessionLocal,
+    SWUCard,
+    SWUCardArena,
+    SWUCardAspect,
+    SWUCardKeyword,
+    SWUCardTrait,
+    SWUMetadata,
+    SWUSet,
+)
+
+TIMED_IMPORT = """
+import time
+start = time.perf_counter()
+import app.main
+print(time.perf_counter() - start)
+"""
+
+
+def snapshot_plan(db) -> dict:
+    return json.loads(db.query(SWUMetadata.value).filter(SWUMetadata.key == "search_options").scalar())
+
+
+def queries_plan(db) -> dict:
+    return {
+        "arena_options": [
+            a.arena for a in db.query(SWUCardArena.arena).distinct().order_by(SWUCardArena.arena).all() if a.arena
+        ],
+        "aspect_options": [
+            {"aspect": a.aspect, "color": a.color}
+            for a in db.query(SWUCardAspect.aspect, SWUCardAspect.color, SWUCardAspect.sort_order)
+            .distinct()
+            .order_by(SWUCardAspect.sort_order)
+            .all()
+            if a.aspect
+        ],
+        "trait_options": [
+            t.trait for t in db.query(SWUCardTrait.trait).distinct().order_by(SWUCardTrait.trait).all() if t.trait
+        ],
+        "keyword_options": [
+            k.keyword
+            for k in db.query(SWUCardKeyword.keyword).distinct().order_by(SWUCardKeyword.keyword).all()
+            if k.keyword
+        ],
+        "card_type_options": [
+            c.card_type for c in db.query(SWUCard.card_type).distinct().order_by(SWUCard.card_type).all()
+        ],
+        "rarity_options": [c.rarity for c in db.query(SWUCard.rarity).distinct().order_by(SWUCard.rarity).all()],
+        "artist_options": [
+            c.artist_search for c in db.query(SWUCard.artist_search).distinct().order_by(SWUCard.artist_search).all()
+        ],
+        "variant_type_options": [
+            c.variant_type for c in db.query(SWUCard.variant_type).distinct().order_by(SWUCard.variant_type).all()
+        ],
+        "rotation_options": [
+            s.rotation for s in db.query(SWUSet.rotation).distinct().order_by(SWUSet.rotation).all() if s.rotation
+        ],
+    }
+
+
+def time_search_options(runs: int):
+    db = SessionLocal()
+    plans = {"snapshot": snapshot_plan, "queries": queries_plan}
+    results = {name: plan(db) for name, plan in plans.items()}
+    if results["queries"] != results["snapshot"]:
+        print("The snapshot's search options differ from the queries'")
+        sys.exit(1)
+    timings = {}
+    for name, plan in plans.items():
+        start = time.perf_counter()
+        for _ in range(runs):
+            plan(db)
+        timings[name] = (time.perf_counter() - start) / runs * 1000
+    db.close()
+    print("Loading search options: " + ", ".join(f"{name}: {ms:.2f} ms" for name, ms in timings.items()))
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"Starting the app {runs} times")
+    # Import the app's dependencies first, so only the app's own startup is timed
+    setup = "import fastapi, sqlalchemy, jinja2, pydantic, brotli"
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", f"{setup}\n{TIMED_IMPORT}"], cwd=ROOT, capture_output=True, text=True, check=True
+        )
+        timings.append(float(result.stdout.strip().splitlines()[-1]) * 1000)
+    timings.sort()
+    print(f"Best: {timings[0]:.0f} ms")
+    print(f"Median: {timings[len(timings) // 2]:.0f} ms")
+    time_search_options(runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,24 @@
+import argparse
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import hashlib
 import json
 import os
 import re
 import sqlite3
+import sys
+from typing import Any
 from unidecode import unidecode
 
 DATA_DIR = os.path.dirname(__file__)
 
+# Make the app package importable, to share its card text formatting and name search folding
+sys.path.append(os.path.abspath(os.path.join(DATA_DIR, "..")))
+from app.card_text import CardTextVocabulary, htmlify_card_text  # noqa: E402
+from app.search import trigrams  # noqa: E402
+from app.suggest import fold  # noqa: E402
+
 ASPECT_SORT_ORDER = {
     "Vigilance": 1,
     "Command": 2,
@@ -63,7 +75,29 @@ ARTIST_SEARCH_REMAP = {
 }
 
 
+# The number a cost, power or HP starts with: a pilot's "4 / +3" is its own stat as a unit, and an upgrade's "-2" or
+# "3" is the (signed) modifier it gives
+STAT_PATTERN = re.compile(r"\s*([+-]?\d+)")
+
+# Child tables of cards, with the columns inserted from each card's rows (after "card_id")
+CHILD_TABLES = {
+    "card_aspects": ("aspect", "color", "sort_order", "double"),
+    "card_traits": ("trait",),
+    "card_arenas": ("arena",),
+    "card_keywords": ("keyword",),
+}
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Build db.sqlite3 from all_cards.json, corrections.json and sets.json")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only rewrite cards whose content changed since the existing database was built",
+    )
+    parser.add_argument("--processes", type=int, default=1, help="number of processes parsing cards in parallel")
+    args = parser.parse_args()
+
     # Load card data
     try:
         all_cards = json.load(open(os.path.join(DATA_DIR, "all_cards.json"), "rb"))
@@ -77,55 +111,13 @@ def main():
     except FileNotFoundError:
         corrections = {}
 
-    card_rows = []
-    aspect_rows = []
-    trait_rows = []
-    arena_rows = []
-    keyword_rows = []
+    # Apply manual corrections
     for card in all_cards:
         card_id = f"{card['Set']}-{card['Number']}"
         if card_id in corrections:
             card.update(corrections[card_id])
-        front_text, front_keywords = clean_card_text(card.get("FrontText"))
-        back_text, back_keywords = clean_card_text(card.get("BackText"))
-        card_rows.append(
-            (
-                card_id,
-                card["Set"],
-                int(card["Number"]),
-                card["Name"],
-                card.get("Subtitle"),
-                card.get("Unique", False),
-                card["Rarity"],
-                card["VariantType"],
-                card["Type"],
-                card.get("Cost"),
-                card.get("Power"),
-                card.get("HP"),
-                front_text,
-                card.get("DoubleSided", False),
-                card.get("EpicAction"),
-                back_text,
-                card["Artist"],
-                unidecode(ARTIST_SEARCH_REMAP.get(card["Artist"], card["Artist"])),  # type: ignore
-            )
-        )
-        if card.get("Aspects") == []:
-            del card["Aspects"]
-        for aspect, n in Counter(card.get("Aspects", [None])).items():
-            aspect = None if aspect == "" else aspect
-            aspect_rows.append((card_id, aspect, ASPECT_COLORS.get(aspect), ASPECT_SORT_ORDER[aspect], int(n > 1)))  # type: ignore
-        for trait in card.get("Traits", [None]):
-            trait_rows.append((card_id, trait))
-        for arena in card.get("Arenas", [None]):
-            arena_rows.append((card_id, arena))
-        keywords = front_keywords | back_keywords
-        if not keywords:
-            keywords.add(None)  # type: ignore
-        for keyword in keywords:
-            keyword_rows.append((card_id, keyword))
-        if not keyword_rows:
-            keyword_rows.append(None)
+
+    cards = parse_cards(all_cards, processes=args.processes)
     print("Parsed card data into rows for insertion into database")
 
     # Load set data
@@ -134,133 +126,422 @@ def main():
     set_rows = [(s["id"], s["number"], s["rotation"], s["name"]) for s in sets]
     print("Parsed set data into rows for insertion into database")
 
+    # Identify this build by a hash of its contents
+    card_rows = [rows["cards"] for rows in cards.values()]
+    child_rows = [[row for rows in cards.values() for row in rows[table]] for table in CHILD_TABLES]
+    build_version = hashlib.sha256(json.dumps([set_rows, card_rows, *child_rows]).encode("utf-8")).hexdigest()[:16]
+    print(f"Build version {build_version}")
+    metadata = {"build_version": build_version, "search_options": json.dumps(search_options(set_rows, cards))}
+
+    # Build into a temporary file and swap it in, so a running server never sees a missing or partial database
     db = os.path.join(DATA_DIR, "db.sqlite3")
-    if os.path.exists(db):
-        print(f"Deleting existing database {db}")
-        os.remove(db)
-    with sqlite3.connect(db) as con:
-        print(f"Initialized database {db}")
-        cur = con.cursor()
-
-        print(f"Creating sets table ({len(sets):,} rows)")
-        cur.execute(
-            """
-            CREATE TABLE sets (
-                "id" TEXT PRIMARY KEY,
-                "number" INTEGER NOT NULL,
-                "rotation" TEXT,
-                "name" TEXT NOT NULL
-            )
-            """
+    tmp_db = f"{db}.tmp"
+    if os.path.exists(tmp_db):
+        os.remove(tmp_db)
+    con = sqlite3.connect(tmp_db)
+    if args.incremental and os.path.exists(db) and has_current_schema(db):
+        print(f"Copying existing database {db} to {tmp_db}")
+        source = sqlite3.connect(db)
+        source.backup(con)
+        source.close()
+        update_database(con, set_rows, cards, metadata)
+    else:
+        if args.incremental:
+            print(f"No existing database {db} with the current schema, building from scratch")
+        print(f"Initialized database {tmp_db}")
+        create_database(con, set_rows, cards, metadata)
+    con.close()
+    os.replace(tmp_db, db)
+    print(f"Replaced database {db}")
+
+
+def parse_cards(all_cards: list[dict], processes: int = 1) -> dict[str, dict[str, Any]]:
+    """Return each card's row for the cards table and its child tables' rows, keyed by card ID.
+    With processes > 1, cards are parsed in that many worker processes.
+    """
+    # Get all traits and keywords, for linking them in pre-rendered card text
+    all_traits = sorted({trait for card in all_cards for trait in card.get("Traits", []) if trait})
+    vocabulary = CardTextVocabulary(all_traits, sorted(KEYWORDS))
+
+    if processes > 1:
+        with ProcessPoolExecutor(processes) as executor:
+            chunksize = max(1, len(all_cards) // (processes * 4))
+            return dict(executor.map(partial(parse_card, vocabulary=vocabulary), all_cards, chunksize=chunksize))
+    return dict(parse_card(card, vocabulary) for card in all_cards)
+
+
+def parse_card(card: dict, vocabulary: CardTextVocabulary) -> tuple[str, dict[str, Any]]:
+    """Return a card's ID, and its row for the cards table and its child tables' rows.
+    The card row ends with a hash of the card's content (its other columns and child rows).
+    """
+    card_id = f"{card['Set']}-{card['Number']}"
+    front_text, front_keywords = clean_card_text(card.get("FrontText"))
+    back_text, back_keywords = clean_card_text(card.get("BackText"))
+    keywords = sorted(front_keywords | back_keywords)
+    is_pilot = "PILOT" in card.get("Traits", [])
+    html_args = (card["VariantType"], keywords, vocabulary)
+    card_row = (
+        card_id,
+        card["Set"],
+        int(card["Number"]),
+        card["Name"],
+        card.get("Subtitle"),
+        card.get("Unique", False),
+        card["Rarity"],
+        card["VariantType"],
+        card["Type"],
+        card.get("Cost"),
+        card.get("Power"),
+        card.get("HP"),
+        front_text,
+        card.get("DoubleSided", False),
+        card.get("EpicAction"),
+        back_text,
+        card["Artist"],
+        unidecode(ARTIST_SEARCH_REMAP.get(card["Artist"], card["Artist"])),  # type: ignore
+        htmlify_card_text(front_text or "", *html_args, is_pilot=is_pilot),
+        htmlify_card_text(back_text or "", *html_args, is_pilot=is_pilot),
+        htmlify_card_text(card.get("EpicAction") or "", *html_args),
+        variant_group_id(card),
+        stat_value(card.get("Cost")),
+        stat_value(card.get("Power")),
+        stat_value(card.get("HP")),
+        fold(f"{card['Name']} {card.get('Subtitle') or ''}"),
+    )
+    if card.get("Aspects") == []:
+        del card["Aspects"]
+    rows = {
+        "card_aspects": [
+            (card_id, aspect, ASPECT_COLORS.get(aspect), ASPECT_SORT_ORDER[aspect], int(n > 1))  # type: ignore
+            for aspect, n in Counter(None if a == "" else a for a in card.get("Aspects", [None])).items()
+        ],
+        "card_traits": [(card_id, trait) for trait in card.get("Traits", [None])],
+        "card_arenas": [(card_id, arena) for arena in card.get("Arenas", [None])],
+        "card_keywords": [(card_id, keyword) for keyword in keywords or [None]],
+    }
+    content_hash = hashlib.sha256(json.dumps([card_row, rows]).encode("utf-8")).hexdigest()[:16]
+    return card_id, {"cards": (*card_row, content_hash), **rows}
+
+
+def variant_group_id(card: dict) -> int:
+    """Return the ID shared by every variant of a card (those with the same name, type and subtitle).
+    It only depends on the card itself, so it's stable across (incremental) builds.
+    """
+    key = json.dumps([card["Name"], card["Type"], card.get("Subtitle")])
+    return int(hashlib.sha256(key.encode("utf-8")).hexdigest()[:15], 16)
+
+
+def stat_value(stat: str | None) -> int | None:
+    """Return the integer value of a cost, power or HP (see STAT_PATTERN), or None if it has none"""
+    match = STAT_PATTERN.match(stat or "")
+    return int(match.group(1)) if match else None
+
+
+def search_options(set_rows: list[tuple], cards: dict[str, dict[str, Any]]) -> dict[str, list]:
+    """Return the sorted, distinct values of each search filter (other than sets), for the app's search form"""
+    card_rows = [rows["cards"] for rows in cards.values()]
+
+    def distinct(table: str, column: int) -> list[str]:
+        return sorted({row[column] for rows in cards.values() for row in rows[table] if row[column]})
+
+    aspects = {row[1:4] for rows in cards.values() for row in rows["card_aspects"] if row[1]}
+    return {
+        "arena_options": distinct("card_arenas", 1),
+        "aspect_options": [
+            {"aspect": aspect, "color": color} for aspect, color, _ in sorted(aspects, key=lambda a: a[2])
+        ],
+        "trait_options": distinct("card_traits", 1),
+        "keyword_options": distinct("card_keywords", 1),
+        "card_type_options": sorted({row[8] for row in card_rows}),
+        "rarity_options": sorted({row[6] for row in card_rows}),
+        "artist_options": sorted({row[17] for row in card_rows}),
+        "variant_type_options": sorted({row[7] for row in card_rows}),
+        "rotation_options": sorted({row[2] for row in set_rows if row[2]}),
+    }
+
+
+def name_trigram_rows(cards: dict[str, dict[str, Any]]) -> list[tuple[str, str]]:
+    """Return the (trigram, name_search) rows of the name_trigrams index, for every distinct folded name/subtitle"""
+    names = sorted({rows["cards"][-2] for rows in cards.values()})
+    return [(trigram, name) for name in names for trigram in sorted(trigrams(name))]
+
+
+def has_current_schema(db: str) -> bool:
+    """Return whether an existing database has every current column of the cards table, including each card's
+    content hash (so it can be updated incrementally)
+    """
+    con = sqlite3.connect(db)
+    columns = [row[1] for row in con.execute("""PRAGMA table_info(cards)""")]
+    con.close()
+    return {"content_hash", "cost_value", "power_value", "hp_value", "name_search"} <= set(columns)
+
+
+def insert_cards(cur: sqlite3.Cursor, cards: dict[str, dict[str, Any]]):
+    """Insert the rows of the given cards (from parse_cards) into the cards, card_search and child tables"""
+    card_rows = [rows["cards"] for rows in cards.values()]
+    if not card_rows:
+        return
+    cur.executemany(f"""INSERT INTO cards VALUES({",".join("?" * len(card_rows[0]))})""", card_rows)
+    cur.executemany(
+        """
+        INSERT INTO card_search ("card_id", "name", "subtitle", "front_text", "epic_action", "back_text")
+        SELECT "id", "name", "subtitle", "front_text", "epic_action", "back_text" FROM cards WHERE "id" = ?
+        """,
+        [(card_id,) for card_id in cards],
+    )
+    for table, columns in CHILD_TABLES.items():
+        cur.executemany(
+            f"""INSERT INTO {table} ("card_id", {", ".join(f'"{c}"' for c in columns)}) """
+            f"""VALUES({",".join("?" * (len(columns) + 1))})""",
+            [row for rows in cards.values() for row in rows[table]],
+        )
+
+
+def update_database(
+    con: sqlite3.Connection, set_rows: list[tuple], cards: dict[str, dict[str, Any]], metadata: dict[str, str]
+):
+    """Upsert the changed cards and delete the removed cards (and their child rows) in an existing database, and
+    replace its sets and metadata
+    """
+    cur = con.cursor()
+    existing = dict(cur.execute("""SELECT "id", "content_hash" FROM cards"""))
+    changed = {card_id: rows for card_id, rows in cards.items() if existing.get(card_id) != rows["cards"][-1]}
+    removed = existing.keys() - cards.keys()
+    print(f"Updating {len(changed):,} changed cards and deleting {len(removed):,} removed cards")
+
+    stale_ids = [(card_id,) for card_id in [*changed, *removed]]
+    for table in ("card_search", *CHILD_TABLES):
+        cur.executemany(f"""DELETE FROM {table} WHERE "card_id" = ?""", stale_ids)
+    cur.executemany("""DELETE FROM cards WHERE "id" = ?""", stale_ids)
+    insert_cards(cur, changed)
+    cur.execute("""DELETE FROM name_trigrams""")
+    cur.executemany("""INSERT INTO name_trigrams VALUES(?,?)""", name_trigram_rows(cards))
+
+    cur.execute("""DELETE FROM sets""")
+    cur.executemany("""INSERT INTO sets VALUES(?,?,?,?)""", set_rows)
+    cur.executemany("""INSERT OR REPLACE INTO metadata VALUES(?,?)""", metadata.items())
+    con.commit()
+
+
+def create_database(
+    con: sqlite3.Connection, set_rows: list[tuple], cards: dict[str, dict[str, Any]], metadata: dict[str, str]
+):
+    """Create every table and index in an empty database, and insert all the sets and cards"""
+    cur = con.cursor()
+
+    print(f"Creating sets table ({len(set_rows):,} rows)")
+    cur.execute(
+        """
+        CREATE TABLE sets (
+            "id" TEXT PRIMARY KEY,
+            "number" INTEGER NOT NULL,
+            "rotation" TEXT,
+            "name" TEXT NOT NULL
         )
-        cur.executemany("""INSERT INTO sets VALUES(?,?,?,?)""", set_rows)
-        con.commit()
-
-        print(f"Creating cards table ({len(card_rows):,} rows)")
-        cur.execute(
-            """
-            CREATE TABLE cards (
-                "id" TEXT PRIMARY KEY,
-                "set_id" TEXT NOT NULL,
-                "number" INTEGER NOT NULL,
-                "name" TEXT NOT NULL,
-                "subtitle" TEXT,
-                "unique" INTEGER NOT NULL,
-                "rarity" TEXT NOT NULL,
-                "variant_type" TEXT NOT NULL,
-                "card_type" TEXT NOT NULL,
-                "cost" TEXT,
-                "power" TEXT,
-                "hp" TEXT,
-                "front_text" TEXT,
-                "double_sided" INTEGER NOT NULL,
-                "epic_action" TEXT,
-                "back_text" TEXT,
-                "artist" TEXT NOT NULL,
-                "artist_search" TEXT NOT NULL,
-                FOREIGN KEY ("set_id") REFERENCES sets("id")
-            )
-            """
+        """
+    )
+    cur.executemany("""INSERT INTO sets VALUES(?,?,?,?)""", set_rows)
+
+    print(f"Creating cards table and card_search full-text index ({len(cards):,} rows)")
+    cur.execute(
+        """
+        CREATE TABLE cards (
+            "id" TEXT PRIMARY KEY,
+            "set_id" TEXT NOT NULL,
+            "number" INTEGER NOT NULL,
+            "name" TEXT NOT NULL,
+            "subtitle" TEXT,
+            "unique" INTEGER NOT NULL,
+            "rarity" TEXT NOT NULL,
+            "variant_type" TEXT NOT NULL,
+            "card_type" TEXT NOT NULL,
+            "cost" TEXT,
+            "power" TEXT,
+            "hp" TEXT,
+            "front_text" TEXT,
+            "double_sided" INTEGER NOT NULL,
+            "epic_action" TEXT,
+            "back_text" TEXT,
+            "artist" TEXT NOT NULL,
+            "artist_search" TEXT NOT NULL,
+            "front_text_rendered" TEXT,
+            "back_text_rendered" TEXT,
+            "epic_action_rendered" TEXT,
+            "variant_group_id" INTEGER NOT NULL,
+            "cost_value" INTEGER,
+            "power_value" INTEGER,
+            "hp_value" INTEGER,
+            "name_search" TEXT NOT NULL,
+            "content_hash" TEXT NOT NULL,
+            FOREIGN KEY ("set_id") REFERENCES sets("id")
         )
-        cur.executemany(f"""INSERT INTO cards VALUES({",".join("?" * len(card_rows[0]))})""", card_rows)
-        con.commit()
-
-        print(f"Creating card_aspects table ({len(aspect_rows):,} rows)")
-        cur.execute(
-            """
-            CREATE TABLE card_aspects (
-                "id" INTEGER PRIMARY KEY AUTOINCREMENT,
-                "card_id" TEXT NOT NULL,
-                "aspect" TEXT,
-                "color" TEXT,
-                "sort_order" INTEGER NOT NULL,
-                "double" INTEGER NOT NULL,
-                FOREIGN KEY ("card_id") REFERENCES cards("id")
-            )
-            """
+        """
+    )
+    cur.execute(
+        """
+        CREATE VIRTUAL TABLE card_search USING fts5(
+            "card_id" UNINDEXED,
+            "name",
+            "subtitle",
+            "front_text",
+            "epic_action",
+            "back_text",
+            tokenize="trigram"
         )
-        cur.executemany(
-            """INSERT INTO card_aspects ("card_id", "aspect", "color", "sort_order", "double") VALUES(?,?,?,?,?)""",
-            aspect_rows,
+        """
+    )
+
+    print("Creating card_aspects, card_traits, card_arenas and card_keywords tables")
+    cur.execute(
+        """
+        CREATE TABLE card_aspects (
+            "id" INTEGER PRIMARY KEY AUTOINCREMENT,
+            "card_id" TEXT NOT NULL,
+            "aspect" TEXT,
+            "color" TEXT,
+            "sort_order" INTEGER NOT NULL,
+            "double" INTEGER NOT NULL,
+            FOREIGN KEY ("card_id") REFERENCES cards("id")
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE card_traits (
+            "id" INTEGER PRIMARY KEY AUTOINCREMENT,
+            "card_id" TEXT NOT NULL,
+            "trait" TEXT,
+            FOREIGN KEY ("card_id") REFERENCES cards("id")
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE card_arenas (
+            "id" INTEGER PRIMARY KEY AUTOINCREMENT,
+            "card_id" TEXT NOT NULL,
+            "arena" TEXT,
+            FOREIGN KEY ("card_id") REFERENCES cards("id")
         )
-        con.commit()
-
-        print(f"Creating card_traits table ({len(trait_rows):,} rows)")
-        cur.execute(
-            """
-            CREATE TABLE card_traits (
-                "id" INTEGER PRIMARY KEY AUTOINCREMENT,
-                "card_id" TEXT NOT NULL,
-                "trait" TEXT,
-                FOREIGN KEY ("card_id") REFERENCES cards("id")
-            )
-            """
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE card_keywords (
+            "id" INTEGER PRIMARY KEY AUTOINCREMENT,
+            "card_id" TEXT NOT NULL,
+            "keyword" TEXT,
+            FOREIGN KEY ("card_id") REFERENCES cards("id")
         )
-        cur.executemany("""INSERT INTO card_traits ("card_id", "trait") VALUES(?,?)""", trait_rows)
-        con.commit()
-
-        print(f"Creating card_arenas table ({len(arena_rows):,} rows)")
-        cur.execute(
-            """
-            CREATE TABLE card_arenas (
-                "id" INTEGER PRIMARY KEY AUTOINCREMENT,
-                "card_id" TEXT NOT NULL,
-                "arena" TEXT,
-                FOREIGN KEY ("card_id") REFERENCES cards("id")
-            )
-            """
+        """
+    )
+    insert_cards(cur, cards)
+
+    print("Creating name_trigrams index of folded names and subtitles, for fuzzy name search")
+    cur.execute(
+        """
+        CREATE TABLE name_trigrams (
+            "trigram" TEXT NOT NULL,
+            "name_search" TEXT NOT NULL
+        )
+        """
+    )
+    cur.executemany("""INSERT INTO name_trigrams VALUES(?,?)""", name_trigram_rows(cards))
+
+    print("Creating metadata table")
+    cur.execute(
+        """
+        CREATE TABLE metadata (
+            "key" TEXT PRIMARY KEY,
+            "value" TEXT NOT NULL
         )
-        cur.executemany("""INSERT INTO card_arenas ("card_id", "arena") VALUES(?,?)""", arena_rows)
-        con.commit()
-
-        print(f"Creating card_keywords table ({len(keyword_rows):,} rows)")
-        cur.execute(
-            """
-            CREATE TABLE card_keywords (
-                "id" INTEGER PRIMARY KEY AUTOINCREMENT,
-                "card_id" TEXT NOT NULL,
-                "keyword" TEXT,
-                FOREIGN KEY ("card_id") REFERENCES cards("id")
-            )
-            """
+        """
+    )
+    cur.executemany("""INSERT INTO metadata VALUES(?,?)""", metadata.items())
+
+    print("Adding indices")
+    cur.execute("""CREATE INDEX set_id_index ON sets (id)""")
+    cur.execute("""CREATE INDEX set_search_index ON cards (number, name)""")
+    cur.execute("""CREATE INDEX card_id_index ON cards (id)""")
+    cur.execute("""CREATE INDEX card_search_index ON cards (set_id, variant_type, card_type, rarity, artist)""")
+    cur.execute("""CREATE INDEX variant_group_index ON cards (variant_group_id)""")
+    cur.execute("""CREATE INDEX cost_search_index ON cards (card_type, cost_value, power_value, hp_value)""")
+    cur.execute("""CREATE INDEX power_search_index ON cards (card_type, power_value, hp_value)""")
+    cur.execute("""CREATE INDEX hp_search_index ON cards (card_type, hp_value)""")
+    cur.execute("""CREATE INDEX aspect_card_id_index ON card_aspects (card_id)""")
+    cur.execute("""CREATE INDEX aspect_search_index ON card_aspects (aspect, sort_order)""")
+    cur.execute("""CREATE INDEX trait_card_id_index ON card_traits (card_id)""")
+    cur.execute("""CREATE INDEX trait_search_index ON card_traits (trait)""")
+    cur.execute("""CREATE INDEX arena_card_id_index ON card_arenas (card_id)""")
+    cur.execute("""CREATE INDEX arena_search_index ON card_arenas (arena)""")
+    cur.execute("""CREATE INDEX keyword_card_id_index ON card_keywords (card_id)""")
+    cur.execute("""CREATE INDEX keyword_search_index ON card_keywords (keyword)""")
+    cur.execute("""CREATE INDEX name_trigram_index ON name_trigrams (trigram)""")
+    con.commit()
+
+
+# Keyword patterns for clean_card_text, compiled once. Each finds a keyword (group "keyword", and optionally a 2nd in
+# group "keyword2") and rebuilds the match with the keyword(s) in upper case. The text that each pattern requires
+# (lower case) is checked first with a plain substring search, which is much faster than a case-insensitive regex.
+KW_GRP = "|".join(sorted(KEYWORDS))  # Group of all possible keywords
+NOT_UNLESS = "(?<!unless he)(?<!unless she)(?<!unless it)"  # Negative lookbehind for "unless he/she/it"
+ANY_KEYWORD = [keyword.lower() for keyword in sorted(KEYWORDS)] + ["bounties"]  # Lines with none match no pattern
+LEADING_KEYWORD_PATTERN = re.compile(  # Lines starting with a keyword (and an optional 2nd)
+    rf"(?P<keyword>{KW_GRP})(?P<value> \d+)?(?P<sep>, (?P<keyword2>{KW_GRP}))?", re.IGNORECASE
+)
+KEYWORD_PATTERNS = [
+    (required, re.compile(pattern, re.IGNORECASE))
+    for required, pattern in [
+        # "gain(s) {keyword}" (but not "unless he/she/it gains {keyword}")
+        (
+            " gain",
+            rf"(?P<prefix>{NOT_UNLESS} gains?:?,? \"?)(?P<keyword>{KW_GRP})(?P<value> \d+)?"
+            rf"(?P<sep> and (?P<keyword2>{KW_GRP}))?",
+        ),
+        (" keyword", rf"(?P<keyword>{KW_GRP})(?P<suffix> keyword)"),  # "{keyword} keyword"
+        # Common 2-part keyword patterns w/ keyword 2nd
+        ("coordinate - ", rf"(?P<prefix>COORDINATE - )(?P<keyword>{KW_GRP})"),  # "COORDINATE - {keyword}"
+        ("give it ", rf"(?P<prefix>give it )(?P<keyword>{KW_GRP})"),  # "give it {keyword}"
+        (
+            "give ",
+            rf"(?P<prefix>give (?:each|a|an) (?:[^.]+ )?unit )(?P<keyword>{KW_GRP})",
+        ),  # "give each/a(n) {qualifier?} unit {keyword}"
+        ("using ", rf"(?P<prefix>using )(?P<keyword>{KW_GRP})"),  # "using {keyword}"
+        (
+            " has ",
+            rf"(?P<prefix>{NOT_UNLESS} has )(?P<keyword>{KW_GRP})",
+        ),  # "has {keyword}" (but not "unless he/she/it has {keyword}")
+        (" with ", rf"(?P<prefix>(?:cards?|units?) with )(?P<keyword>{KW_GRP})"),  # "card(s)/unit(s) with {keyword}"
+        (
+            "all abilities except for ",
+            rf"(?P<prefix>all abilities except for )(?P<keyword>{KW_GRP})",
+        ),  # "abilities except for {keyword}"
+        (" a bounty", r"(?P<prefix>(?:has|with) a )(?P<keyword>bounty)"),  # "has/with a {bounty}"
+        ("collect ", r"(?P<prefix>collect [^.]+ )(?P<keyword>bounties)"),  # "collect ... bounties" (BOUNTY keyword)
+    ]
+]
+
+
+def _uppercase_keywords(match: re.Match) -> str:
+    groups = match.groupdict()
+    sep = groups.get("sep")
+    return "".join(
+        (
+            groups.get("prefix") or "",
+            match["keyword"].upper(),
+            groups.get("value") or "",
+            f"{sep[: -len(groups['keyword2'])]}{groups['keyword2'].upper()}" if sep else "",
+            groups.get("suffix") or "",
         )
-        cur.executemany("""INSERT INTO card_keywords ("card_id", "keyword") VALUES(?,?)""", keyword_rows)
-        con.commit()
-
-        print("Adding indices")
-        cur.execute("""CREATE INDEX set_id_index ON sets (id)""")
-        cur.execute("""CREATE INDEX set_search_index ON cards (number, name)""")
-        cur.execute("""CREATE INDEX card_id_index ON cards (id)""")
-        cur.execute("""CREATE INDEX card_search_index ON cards (set_id, variant_type, card_type, rarity, artist)""")
-        cur.execute("""CREATE INDEX aspect_card_id_index ON card_aspects (card_id)""")
-        cur.execute("""CREATE INDEX aspect_search_index ON card_aspects (aspect, sort_order)""")
-        cur.execute("""CREATE INDEX trait_card_id_index ON card_traits (card_id)""")
-        cur.execute("""CREATE INDEX trait_search_index ON card_traits (trait)""")
-        cur.execute("""CREATE INDEX arena_card_id_index ON card_arenas (card_id)""")
-        cur.execute("""CREATE INDEX arena_search_index ON card_arenas (arena)""")
-        cur.execute("""CREATE INDEX keyword_card_id_index ON card_keywords (card_id)""")
-        cur.execute("""CREATE INDEX keyword_search_index ON card_keywords (keyword)""")
-        con.commit()
+    )
+
+
+def _match_keywords(match: re.Match) -> set[str]:
+    keyword = match["keyword"].upper()
+    keywords = {"BOUNTY" if keyword == "BOUNTIES" else keyword}
+    if match.groupdict().get("keyword2"):
+        keywords.add(match["keyword2"].upper())
+    return keywords
 
 
 def clean_card_text(text: str | None) -> tuple[str | None, set[str]]:
@@ -269,64 +550,31 @@ def clean_card_text(text: str | None) -> tuple[str | None, set[str]]:
         return text, keywords
     text = text.replace("{", "").replace("}", "")
     lines = [line.strip() for line in text.split("\n")]
-    KW_GRP = "|".join(KEYWORDS)  # Group of all possible keywords
-    NOT_UNLESS = "(?<!unless he)(?<!unless she)(?<!unless it)"  # Negative lookbehind for "unless he/she/it"
 
     for i in range(len(lines)):
-        # Find lines starting with a keyword (and an optional 2nd)
-        if match := re.match(pattern := rf"({KW_GRP})( \d+)?(, ({KW_GRP}))?", lines[i], re.IGNORECASE):
-            keywords.add(match.group(1).upper())
-            if match.group(4):
-                keywords.add(match.group(4).upper())
-            lines[i] = re.sub(
-                pattern,
-                lambda x: f"{x.group(1).upper()}{x.group(2) or ''}{f', {x.group(4).upper()}' if x.group(3) else ''}",
-                lines[i],
-                flags=re.IGNORECASE,
-            )
-
-        # Find lines with "gain(s) {keyword}" (but not "unless he/she/it gains {keyword}")
-        if match := re.search(
-            pattern := rf"({NOT_UNLESS} gains?:?,? \"?)({KW_GRP})( \d+)?( and ({KW_GRP}))?",
-            lines[i],
-            re.IGNORECASE,
-        ):
-            keywords.add(match.group(2).upper())
-            if match.group(5):
-                keywords.add(match.group(5).upper())
-            lines[i] = re.sub(
-                pattern,
-                lambda x: (
-                    f"{x.group(1)}{x.group(2).upper()}{x.group(3) or ''}{f' and {x.group(5).upper()}' if x.group(4) else ''}"
-                ),
-                lines[i],
-                flags=re.IGNORECASE,
-            )
-
-        # Find lines with "{keyword} keyword"
-        if match := re.search(pattern := rf"({KW_GRP})( keyword)", lines[i], re.IGNORECASE):
-            keywords.add(match.group(1).upper())
-            lines[i] = re.sub(pattern, lambda x: f"{x.group(1).upper()}{x.group(2)}", lines[i], flags=re.IGNORECASE)
-
-        # Find lines with common 2-part keyword patterns w/ keyword 2nd
-        for pattern in [
-            rf"(COORDINATE - )({KW_GRP})",  # "COORDINATE - {keyword}"
-            rf"(give it )({KW_GRP})",  # "give it {keyword}"
-            rf"(give (?:each|a|an) (?:[^.]+ )?unit )({KW_GRP})",  # "give each/a(n) {qualifier?} unit {keyword}"
-            rf"(using )({KW_GRP})",  # "using {keyword}"
-            rf"({NOT_UNLESS} has )({KW_GRP})",  # "has {keyword}" (but not "unless he/she/it has {keyword}")
-            rf"((?:cards?|units?) with )({KW_GRP})",  # "card(s)/unit(s) with {keyword}"
-            rf"(all abilities except for )({KW_GRP})",  # "abilities except for {keyword}"
-            r"((?:has|with) a )(bounty)",  # "has/with a {bounty}"
-        ]:
-            if match := re.search(pattern, lines[i], re.IGNORECASE):
-                keywords.add(match.group(2).upper())
-                lines[i] = re.sub(pattern, lambda x: f"{x.group(1)}{x.group(2).upper()}", lines[i], flags=re.IGNORECASE)
-
-        # Find lines with "collect ... bounties"
-        if match := re.search(pattern := r"(collect [^.]+ )(bounties)", lines[i], re.IGNORECASE):
-            keywords.add("BOUNTY")
-            lines[i] = re.sub(pattern, lambda x: f"{x.group(1)}{x.group(2).upper()}", lines[i], flags=re.IGNORECASE)
+        lower_line = lines[i].lower()
+        if not any(keyword in lower_line for keyword in ANY_KEYWORD):
+            continue
+
+        # Only lines starting with a keyword have their keywords (anywhere in the line) upper-cased by this pattern
+        if match := LEADING_KEYWORD_PATTERN.match(lines[i]):
+            keywords |= _match_keywords(match)
+            lines[i] = LEADING_KEYWORD_PATTERN.sub(_uppercase_keywords, lines[i])
+
+        # Each other pattern adds the keywords of its first match in the line, and upper-cases all of its matches
+        for required, pattern in KEYWORD_PATTERNS:
+            if required not in lower_line:
+                continue
+            first_match = None
+
+            def replace(match: re.Match) -> str:
+                nonlocal first_match
+                first_match = first_match or match
+                return _uppercase_keywords(match)
+
+            lines[i] = pattern.sub(replace, lines[i])
+            if first_match:
+                keywords |= _match_keywords(first_match)
 
     text = "\n".join(lines)
     return text, keywords
@@ -1,7 +1,13 @@
+import argparse
+import hashlib
 import json
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 DATA_DIR = os.path.dirname(__file__)
 SWU_API_URL = "https://api.swu-db.com"
@@ -26,47 +32,141 @@ DROP_PROPERTIES = [
     "LowFoilPrice",
 ]
 
+# API responses, revalidated with their ETag/Last-Modified so a refresh only re-downloads what changed
+CACHE_DIR = os.path.join(DATA_DIR, ".cache")
 
-def main():
-    """Collect card data for each set, and write combined array to all_cards.json"""
-    all_cards = []
-    for set_id in FULL_SETS:
-        print(f"Fetching {set_id} card data...")
+
+class CachedAPI:
+    """Thread-safe JSON API client with a connection pool, retries with backoff, and an on-disk response cache"""
+
+    def __init__(self, base_url: str, cache_dir: str = CACHE_DIR, workers: int = 8):
+        self.base_url = base_url.rstrip("/")
+        self.cache_dir = cache_dir
+        self.session = requests.Session()
+        # Once retries run out, return the last response (for raise_for_status) rather than raising RetryError
+        retry = Retry(total=5, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.downloads = 0
+        self.revalidations = 0
+        self.counts_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _cache_path(self, url: str) -> str:
+        return os.path.join(self.cache_dir, f"{hashlib.sha1(url.encode('utf-8')).hexdigest()}.json")
+
+    def get(self, path: str) -> Any:
+        """Return the JSON response for an API path, or raise requests.HTTPError"""
+        url = f"{self.base_url}{path}"
+        cache_path = self._cache_path(url)
         try:
-            response = requests.get(f"{SWU_API_URL}/cards/{set_id}")
-            response.raise_for_status()
-            resp_json = response.json()
-            for card in sorted(resp_json["data"], key=lambda x: x["Number"].zfill(3)):
-                # print(f"{card['Set']}-{card['Number']}: {card['Name']}")
+            with open(cache_path) as f:
+                cached = json.load(f)
+        except FileNotFoundError:
+            cached = None
+        headers = {}
+        if cached and cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+        response = self.session.get(url, headers=headers, timeout=60)
+        if response.status_code == 304 and cached:
+            with self.counts_lock:
+                self.revalidations += 1
+            return cached["body"]
+        response.raise_for_status()
+        with self.counts_lock:
+            self.downloads += 1
+        body = response.json()
+        if response.headers.get("ETag") or response.headers.get("Last-Modified"):
+            with open(f"{cache_path}.{os.getpid()}.tmp", "w") as f:
+                json.dump(
+                    {
+                        "url": url,
+                        "etag": response.headers.get("ETag"),
+                        "last_modified": response.headers.get("Last-Modified"),
+                        "body": body,
+                    },
+                    f,
+                )
+            os.replace(f"{cache_path}.{os.getpid()}.tmp", cache_path)
+        return body
+
+    def close(self):
+        self.session.close()
+
+
+def fetch_set(api: CachedAPI, set_id: str) -> list[dict[str, Any]] | None:
+    """Return the cards of a set, or None if the set's data is not found"""
+    try:
+        return api.get(f"/cards/{set_id}")["data"]
+    except requests.exceptions.HTTPError as e:
+        print(f"Full set data not found for {set_id}: {e}")
+        return None
+
+
+def fetch_card(api: CachedAPI, set_id: str, card_number: int) -> dict[str, Any] | None:
+    """Return a single card, or None if it is not found"""
+    try:
+        return api.get(f"/cards/{set_id}/{card_number}")
+    except requests.exceptions.HTTPError as e:
+        print(f"Error fetching data for {set_id}-{card_number}: {e}")
+        return None
+
+
+def fetch_all_cards(api: CachedAPI, workers: int = 8) -> list[dict[str, Any]]:
+    """Collect card data for each set, fetching sets (and then any cards missing from partial sets) concurrently"""
+    all_cards = []
+    with ThreadPoolExecutor(workers) as executor:
+        print(f"Fetching {', '.join(FULL_SETS)} and *partial* {', '.join(PARTIAL_SETS)} card data...")
+        set_ids = FULL_SETS + list(PARTIAL_SETS)
+        set_cards = dict(zip(set_ids, executor.map(lambda set_id: fetch_set(api, set_id), set_ids)))
+
+        for set_id in FULL_SETS:
+            if set_cards[set_id] is None:
+                raise ValueError(f"Full set data not found for {set_id}")
+            for card in sorted(set_cards[set_id], key=lambda x: x["Number"].zfill(3)):
                 if not card["Number"].endswith("F"):  # Ignore foils
                     all_cards.append(clean_card(card))
-        except requests.exceptions.HTTPError as e:
-            raise ValueError(f"Full set data not found for {set_id}") from e
-    for set_id, card_numbers in PARTIAL_SETS.items():
-        print(f"Fetching *partial* {set_id} card data...")
-        need_cards = set(card_numbers)
-        try:
-            response = requests.get(f"{SWU_API_URL}/cards/{set_id}")
-            response.raise_for_status()
-            resp_json = response.json()
-            for card in sorted(resp_json["data"], key=lambda x: int(x["Number"])):
-                # print(f"{card['Set']}-{card['Number']}: {card['Name']}")
+
+        partial_cards = {}
+        missing_cards = {}
+        for set_id, card_numbers in PARTIAL_SETS.items():
+            need_cards = set(card_numbers)
+            partial_cards[set_id] = []
+            for card in sorted(set_cards[set_id] or [], key=lambda x: int(x["Number"])):
                 if (card_number := int(card["Number"])) in need_cards:
-                    all_cards.append(clean_card(card))
+                    partial_cards[set_id].append(clean_card(card))
                     need_cards.remove(card_number)
-        except requests.exceptions.HTTPError as e:
-            print(f"Full set data not found for {set_id}: {e}")
-        if need_cards:
-            print(f"Fetching {len(need_cards)} remaining {set_id} cards one by one...")
-        for card_number in sorted(need_cards):
-            try:
-                response = requests.get(f"{SWU_API_URL}/cards/{set_id}/{card_number}")
-                response.raise_for_status()
-                card = response.json()
-                # print(f"{card['Set']}-{card['Number']}: {card['Name']}")
-                all_cards.append(clean_card(card))
-            except requests.exceptions.HTTPError as e:
-                print(f"Error fetching data for {set_id}-{card_number}: {e}")
+            missing_cards[set_id] = sorted(need_cards)
+
+        if any(missing_cards.values()):
+            print(f"Fetching {sum(len(n) for n in missing_cards.values()):,} remaining partial set cards one by one...")
+        futures = {
+            set_id: [executor.submit(fetch_card, api, set_id, card_number) for card_number in card_numbers]
+            for set_id, card_numbers in missing_cards.items()
+        }
+        for set_id in PARTIAL_SETS:
+            # Each set's individually fetched cards follow the rest of the set, in card number order
+            all_cards += partial_cards[set_id]
+            all_cards += [clean_card(card) for future in futures[set_id] if (card := future.result()) is not None]
+    return all_cards
+
+
+def main():
+    """Collect card data for each set, and write combined array to all_cards.json"""
+    parser = argparse.ArgumentParser(description="Fetch card data for each set and write it to all_cards.json")
+    parser.add_argument("--base-url", default=SWU_API_URL, help="URL of the card data API")
+    parser.add_argument("--workers", type=int, default=8, help="number of concurrent requests")
+    args = parser.parse_args()
+
+    api = CachedAPI(args.base_url, workers=args.workers)
+    try:
+        all_cards = fetch_all_cards(api, workers=args.workers)
+    finally:
+        api.close()
+    print(f"Downloaded {api.downloads:,} responses, {api.revalidations:,} unchanged since they were cached")
     with open(os.path.join(DATA_DIR, "all_cards.json"), "wb") as f:
         print("Writing data to all_cards.json...")
         f.write(json.dumps(all_cards, indent=2).encode("utf-8"))
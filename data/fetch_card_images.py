@@ -1,12 +1,23 @@
+import argparse
+import hashlib
 import json
+import multiprocessing
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from io import BytesIO
 
 import requests
 from PIL import Image
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+DATA_DIR = os.path.dirname(__file__)
+
+# Make the app package importable, to share its image paths
+sys.path.append(os.path.abspath(os.path.join(DATA_DIR, "..")))
+from app.images import rendition_path  # noqa: E402
 
-OVERWRITE = False  # Set to True to overwrite existing images
 UPDATE_SET_IDS = {
     "SOR",
     "SHD",
@@ -18,48 +29,204 @@ UPDATE_SET_IDS = {
     "LAW",
 }
 
-DATA_DIR = os.path.dirname(__file__)
 IMG_DIR = os.path.abspath(os.path.join(DATA_DIR, "../app/static/images"))
-CARD_IMG_URL = "https://swudb.com/images/cards/{set_id}/{number}.png"
-CARD_BACK_IMG_URL = "https://swudb.com/images/cards/{set_id}/{number}-portrait.png"
+MANIFEST_PATH = f"{IMG_DIR}/cards/manifest.json"
+RENDITION_WIDTHS = (200, 400, 800)  # Smaller copies of each image, for responsive srcsets and thumbnails
+CARD_IMG_BASE_URL = "https://swudb.com/images/cards"
+CARD_IMG_URL = "{base_url}/{set_id}/{number}.png"
+CARD_BACK_IMG_URL = "{base_url}/{set_id}/{number}-portrait.png"
 
+# Source URL, size, content hash and validators of every downloaded image, keyed by its path under cards/
+SOURCES_PATH = os.path.join(DATA_DIR, "card_image_sources.json")
+SAVE_SOURCES_EVERY = 50  # Downloads between saves of the sources file, so interrupted runs resume
 
-def main():
+
+def make_session(workers: int) -> requests.Session:
+    """Return an HTTP session with a connection pool for each worker, retrying transient errors with backoff"""
+    session = requests.Session()
+    retry = Retry(total=5, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def load_sources(path: str) -> dict[str, dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_sources(path: str, sources: dict[str, dict]):
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(dict(sorted(sources.items())), f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def encode_webp(content: bytes, path: str):
+    """Convert a downloaded image to WebP at the given path (run in a worker process)"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.open(BytesIO(content)).save(f"{path}.tmp", "webp")
+    os.replace(f"{path}.tmp", path)
+
+
+def fetch_image(
+    session: requests.Session, encoder: ProcessPoolExecutor, url: str, path: str, source: dict | None
+) -> dict | None:
+    """Download an image and encode it to path, unless it is unchanged since it was recorded in `source`.
+    Return its new source record, or None if it could not be downloaded.
+    """
+    headers = {}
+    if source and os.path.exists(path):
+        if source.get("etag"):
+            headers["If-None-Match"] = source["etag"]
+        if source.get("last_modified"):
+            headers["If-Modified-Since"] = source["last_modified"]
     try:
-        all_cards = json.load(open(os.path.join(DATA_DIR, "all_cards.json"), "rb"))
-    except FileNotFoundError as e:
-        raise RuntimeError("Could not find all_cards.json. Please run fetch_card_data.py to create it.") from e
-    print(f"Loaded {len(all_cards):,} cards' data into memory")
+        response = session.get(url, headers=headers, timeout=60)
+        if response.status_code == 404 and url.endswith("-portrait.png"):
+            url = url.replace("-portrait.png", "-back.png")
+            response = session.get(url, headers=headers, timeout=60)
+        if response.status_code == 304:
+            return source
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"Failed to fetch {url}: {e}")
+        return None
+    content_hash = hashlib.sha256(response.content).hexdigest()
+    if not (source and os.path.exists(path) and source["sha256"] == content_hash):
+        print(f"Fetched {url} -> {path}")
+        encoder.submit(encode_webp, response.content, path).result()
+    return {
+        "url": url,
+        "size": len(response.content),
+        "sha256": content_hash,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+
 
-    print("Fetching card images...")
+def fetch_images(
+    all_cards: list[dict],
+    img_dir: str = IMG_DIR,
+    sources_path: str = SOURCES_PATH,
+    base_url: str = CARD_IMG_BASE_URL,
+    workers: int = 8,
+    processes: int | None = None,
+    refresh: bool = False,
+) -> int:
+    """Download every card face's image that is missing (or revalidate every image if `refresh`: unchanged images
+    are not re-downloaded or re-encoded), with `workers` concurrent downloads and WebP encoding in `processes` worker
+    processes. Return the number of images fetched or checked.
+    """
+    sources = load_sources(sources_path)
+    jobs = {}
     for card in all_cards:
         set_id = card["Set"]
         if UPDATE_SET_IDS and set_id not in UPDATE_SET_IDS:
             continue
         number = card["Number"]
-        double_sided = card.get("DoubleSided", False)
-        url = CARD_IMG_URL.format(set_id=set_id, number=number)
-        fetch_images = {url: f"{IMG_DIR}/cards/{set_id}/{number}.webp"}
-        if double_sided:
-            url_back = CARD_BACK_IMG_URL.format(set_id=set_id, number=number)
-            fetch_images[url_back] = f"{IMG_DIR}/cards/{set_id}/{number}-back.webp"
-        for url, path in fetch_images.items():
-            if OVERWRITE or not os.path.exists(path):
-                if not os.path.exists(os.path.dirname(path)):
-                    os.makedirs(os.path.dirname(path))
-                try:
-                    print(f"Fetching {url} -> {path}")
-                    response = requests.get(url)
-                    if response.status_code == 404 and url.endswith("-portrait.png"):
-                        url = url.replace("-portrait.png", "-back.png")
-                        print(f"Fetching {url} -> {path}")
-                        response = requests.get(url)
-                    response.raise_for_status()
-                except requests.exceptions.HTTPError as e:
-                    print(f"Failed to fetch {url}: {e}")
-                else:
-                    im = Image.open(BytesIO(response.content))
-                    im.save(path, "webp")
+        faces = {f"{set_id}/{number}.webp": CARD_IMG_URL}
+        if card.get("DoubleSided", False):
+            faces[f"{set_id}/{number}-back.webp"] = CARD_BACK_IMG_URL
+        for key, url_format in faces.items():
+            path = os.path.join(img_dir, "cards", key)
+            if refresh or not os.path.exists(path):
+                jobs[key] = (url_format.format(base_url=base_url, set_id=set_id, number=number), path)
+    print(f"Fetching {len(jobs):,} card images...")
+
+    count = 0
+    with (
+        make_session(workers) as session,
+        ThreadPoolExecutor(workers) as downloader,
+        ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn")) as encoder,
+    ):
+        futures = {
+            downloader.submit(fetch_image, session, encoder, url, path, sources.get(key)): key
+            for key, (url, path) in jobs.items()
+        }
+        for future in as_completed(futures):
+            if source := future.result():
+                sources[futures[future]] = source
+                count += 1
+                if count % SAVE_SOURCES_EVERY == 0:
+                    save_sources(sources_path, sources)
+    save_sources(sources_path, sources)
+    return count
+
+
+def make_renditions(path: str) -> list[int]:
+    """Write every rendition of the image narrower than it (if missing or stale), and return the widths of the
+    renditions followed by the image's own width
+    """
+    directory, name = os.path.split(path)
+    im = Image.open(path)
+    widths = []
+    for width in RENDITION_WIDTHS:
+        if width >= im.width:
+            break
+        out_path = rendition_path(directory, name, width)
+        if not os.path.exists(out_path) or os.path.getmtime(out_path) < os.path.getmtime(path):
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            height = round(im.height * width / im.width)
+            im.resize((width, height), Image.Resampling.LANCZOS).save(out_path, "webp", quality=80)
+        widths.append(width)
+    return widths + [im.width]
+
+
+def make_all_renditions(img_dir: str = IMG_DIR, processes: int | None = None) -> dict[str, list[int]]:
+    """Make the renditions of every card image in worker processes, and write their manifest"""
+    cards_dir = os.path.join(img_dir, "cards")
+    keys = []
+    for set_id in sorted(os.listdir(cards_dir)):
+        set_dir = os.path.join(cards_dir, set_id)
+        if os.path.isdir(set_dir):
+            keys += [f"{set_id}/{name}" for name in sorted(os.listdir(set_dir)) if name.endswith(".webp")]
+    with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn")) as executor:
+        paths = [os.path.join(cards_dir, key) for key in keys]
+        manifest = {
+            key.removesuffix(".webp"): widths
+            for key, widths in zip(keys, executor.map(make_renditions, paths, chunksize=32))
+        }
+    with open(os.path.join(cards_dir, os.path.basename(MANIFEST_PATH)), "w") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch card images and make their responsive renditions")
+    parser.add_argument("--base-url", default=CARD_IMG_BASE_URL, help="URL of the card image server")
+    parser.add_argument("--workers", type=int, default=8, help="number of concurrent downloads")
+    parser.add_argument("--processes", type=int, default=None, help="number of image encoding processes")
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="revalidate existing images against the server (unchanged images are not re-downloaded or re-encoded)",
+    )
+    parser.add_argument(
+        "--renditions-only",
+        action="store_true",
+        help="only make the renditions of the images already downloaded (as the Docker build does)",
+    )
+    args = parser.parse_args()
+
+    if not args.renditions_only:
+        try:
+            all_cards = json.load(open(os.path.join(DATA_DIR, "all_cards.json"), "rb"))
+        except FileNotFoundError as e:
+            raise RuntimeError("Could not find all_cards.json. Please run fetch_card_data.py to create it.") from e
+        print(f"Loaded {len(all_cards):,} cards' data into memory")
+
+        count = fetch_images(
+            all_cards, base_url=args.base_url, workers=args.workers, processes=args.processes, refresh=args.refresh
+        )
+        print(f"Fetched or checked {count:,} card images")
+
+    print("Making card image renditions...")
+    manifest = make_all_renditions(processes=args.processes)
+    print(f"Wrote {len(manifest):,} card images' renditions to {MANIFEST_PATH}")
 
 
 if __name__ == "__main__":